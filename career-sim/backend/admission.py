@@ -0,0 +1,344 @@
+import os
+import json
+import math
+import time
+import asyncio
+import weakref
+from deadlines import DeadlineExceeded, current_deadline, current_priority, CURRENT_PRIORITY, PRIORITY_INTERACTIVE, PRIORITY_BULK, PRIORITIES
+
+# --- Upstream Rate Limits ---
+# Without limits a burst fans out to every (key, model) pair at once and turns
+# into a 429 storm. Each key and each model gets a token bucket (requests/s
+# with a burst allowance) and an in-flight cap; an attempt needs a permit from
+# both, and pairs without capacity are skipped rather than hammered.
+KEY_RPS = float(os.getenv("LLM_KEY_RPS", "2"))
+KEY_BURST = int(os.getenv("LLM_KEY_BURST", "10"))
+KEY_MAX_CONCURRENCY = int(os.getenv("LLM_KEY_MAX_CONCURRENCY", "8"))
+MODEL_RPS = float(os.getenv("LLM_MODEL_RPS", "4"))
+MODEL_BURST = int(os.getenv("LLM_MODEL_BURST", "20"))
+MODEL_MAX_CONCURRENCY = int(os.getenv("LLM_MODEL_MAX_CONCURRENCY", "16"))
+# Per-model overrides, e.g. LLM_MODEL_LIMITS='{"openai/gpt-3.5-turbo": {"rps": 10, "burst": 40, "concurrency": 32}}'
+MODEL_LIMITS = json.loads(os.getenv("LLM_MODEL_LIMITS", "{}"))
+# Share of every key/model limit (in-flight slots and bucket tokens) that bulk
+# work may not use, so a burst of roadmaps/assessments cannot take the capacity
+# a live chat or interview turn needs. Interactive calls may use all of it.
+INTERACTIVE_RESERVED_SHARE = float(os.getenv("LLM_INTERACTIVE_RESERVED_SHARE", "0.25"))
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self, now: float, reserve: float = 0) -> bool:
+        self._refill(now)
+        return self.tokens >= 1 + reserve
+
+    def take(self):
+        self.tokens -= 1
+
+    def wait_time(self, now: float, reserve: float = 0) -> float:
+        """Seconds until a token can be taken without dipping into `reserve`"""
+        self._refill(now)
+        missing = 1 + reserve - self.tokens
+        return 0.0 if missing <= 0 else missing / self.rate if self.rate > 0 else float("inf")
+
+class Limit:
+    """Token bucket plus an in-flight cap for one key or one model"""
+
+    def __init__(self, rate: float, burst: int, max_concurrency: int):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        # Headroom only interactive calls may use; bulk always keeps at least one slot/token
+        self.reserved_slots = max(0, min(max_concurrency - 1, math.ceil(max_concurrency * INTERACTIVE_RESERVED_SHARE)))
+        self.reserved_tokens = max(0.0, min(burst - 1, burst * INTERACTIVE_RESERVED_SHARE))
+
+    def _cap(self, priority: str):
+        if priority == PRIORITY_INTERACTIVE:
+            return self.max_concurrency, 0.0
+        return self.max_concurrency - self.reserved_slots, self.reserved_tokens
+
+    def has_slot(self, priority: str) -> bool:
+        return self.in_flight < self._cap(priority)[0]
+
+    def has_capacity(self, now: float, priority: str = PRIORITY_INTERACTIVE) -> bool:
+        slots, reserve = self._cap(priority)
+        return self.in_flight < slots and self.bucket.available(now, reserve)
+
+    def wait_time(self, now: float, priority: str) -> float:
+        return self.bucket.wait_time(now, self._cap(priority)[1])
+
+    def snapshot(self, now: float) -> dict:
+        self.bucket._refill(now)
+        return {"in_flight": self.in_flight, "tokens": round(self.bucket.tokens, 2)}
+
+class Permit:
+    def __init__(self, limiter, limits):
+        self._limiter = limiter
+        self._limits = limits
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        for limit in self._limits:
+            limit.in_flight -= 1
+        self._limiter._wake()
+
+class UpstreamLimiter:
+    def __init__(self):
+        self._keys = {}
+        self._models = {}
+        self._changed = weakref.WeakKeyDictionary()  # loop -> asyncio.Event set on every release
+        self._waiting = dict.fromkeys(PRIORITIES, 0)  # callers blocked in acquire_any, by priority
+        self.throttled = dict.fromkeys(PRIORITIES, 0)  # attempts that had to wait for capacity
+
+    def _key_limit(self, key_idx: int) -> Limit:
+        if key_idx not in self._keys:
+            self._keys[key_idx] = Limit(KEY_RPS, KEY_BURST, KEY_MAX_CONCURRENCY)
+        return self._keys[key_idx]
+
+    def _model_limit(self, model: str) -> Limit:
+        if model not in self._models:
+            cfg = MODEL_LIMITS.get(model, {})
+            self._models[model] = Limit(
+                cfg.get("rps", MODEL_RPS), cfg.get("burst", MODEL_BURST), cfg.get("concurrency", MODEL_MAX_CONCURRENCY)
+            )
+        return self._models[model]
+
+    def _wake(self):
+        for event in self._changed.values():
+            event.set()
+
+    def _outranked(self, priority: str) -> bool:
+        """A higher-priority caller is already waiting: freed capacity goes to it first"""
+        return any(self._waiting[p] for p in PRIORITIES[:PRIORITIES.index(priority)])
+
+    def _take(self, key_idx: int, model: str, priority: str):
+        now = time.monotonic()
+        limits = (self._key_limit(key_idx), self._model_limit(model))
+        if not all(limit.has_capacity(now, priority) for limit in limits):
+            return None
+        for limit in limits:
+            limit.bucket.take()
+            limit.in_flight += 1
+        return Permit(self, limits)
+
+    def try_acquire(self, key_idx: int, model: str):
+        """Permit for one attempt on (key, model), or None if either is at capacity for this request's priority"""
+        priority = current_priority()
+        if self._outranked(priority):
+            return None
+        return self._take(key_idx, model, priority)
+
+    def _next_refill(self, pairs, priority: str):
+        """Seconds until some pair's buckets refill, or None if every pair waits on in-flight calls"""
+        now = time.monotonic()
+        waits = []
+        for key_idx, _, model in pairs:
+            limits = (self._key_limit(key_idx), self._model_limit(model))
+            if all(limit.has_slot(priority) for limit in limits):
+                waits.append(max(limit.wait_time(now, priority) for limit in limits))
+        return min(waits) if waits else None
+
+    async def acquire_any(self, pairs: list, deadline=None):
+        """
+        ((key_idx, key, model), permit) for the first pair in `pairs` (router order)
+        with capacity, waiting for a release or refill if none has any.
+        While waiting, higher-priority callers are served before lower ones.
+        Raises DeadlineExceeded if the request's budget runs out while waiting.
+        """
+        deadline = deadline or current_deadline()
+        priority = current_priority()
+        waited = False
+        try:
+            while True:
+                if not self._outranked(priority):
+                    for pair in pairs:
+                        permit = self._take(pair[0], pair[2], priority)
+                        if permit is not None:
+                            return pair, permit
+                if not waited:
+                    waited = True
+                    self._waiting[priority] += 1
+                    self.throttled[priority] += 1
+                changed = self._changed.setdefault(asyncio.get_running_loop(), asyncio.Event())
+                changed.clear()
+                timeout = self._next_refill(pairs, priority)
+                if deadline is not None:
+                    deadline.check()
+                    timeout = deadline.remaining() if timeout is None else min(timeout, deadline.remaining())
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    if deadline is not None and deadline.expired:
+                        raise DeadlineExceeded(deadline.budget) from None
+        finally:
+            if waited:
+                self._waiting[priority] -= 1
+                self._wake()  # lower-priority callers that stood aside may go now
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return {
+            "keys": {f"key_{k + 1}": l.snapshot(now) for k, l in self._keys.items()},
+            "models": {m: l.snapshot(now) for m, l in self._models.items()},
+            "waiting": dict(self._waiting),
+            "throttled_attempts": dict(self.throttled),
+        }
+
+UPSTREAM_LIMITER = UpstreamLimiter()
+
+# --- Admission Control ---
+# At most ADMISSION_MAX_ACTIVE LLM requests run at once and ADMISSION_MAX_QUEUE
+# wait behind them. Past that, requests are refused at once with 503 +
+# Retry-After: queueing them would only pile up work that times out anyway.
+ADMISSION_MAX_ACTIVE = int(os.getenv("ADMISSION_MAX_ACTIVE", "32"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+# Active slots bulk requests can never fill (capped at half of ADMISSION_MAX_ACTIVE);
+# queued interactive requests are admitted ahead of queued bulk ones.
+ADMISSION_INTERACTIVE_RESERVED = int(os.getenv("ADMISSION_INTERACTIVE_RESERVED", "8"))
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: int):
+        self.retry_after = retry_after
+        super().__init__("Server is busy. Please retry shortly.")
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_active: int = ADMISSION_MAX_ACTIVE,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        interactive_reserved: int = ADMISSION_INTERACTIVE_RESERVED,
+    ):
+        if max_active < 1:
+            # Nothing could ever be admitted, and retry_after() would divide by zero
+            raise ValueError(f"ADMISSION_MAX_ACTIVE must be at least 1 (got {max_active})")
+        self.max_active = max_active
+        self.max_queue = max_queue
+        # Never more than half the slots, so small deployments still make progress on bulk work
+        self.interactive_reserved = min(interactive_reserved, max_active // 2)
+        self.active = dict.fromkeys(PRIORITIES, 0)
+        self._waiters = {p: [] for p in PRIORITIES}  # futures of queued requests, FIFO per priority
+        self._service_ewma = 5.0  # seconds a request holds its slot
+        self.rejected = dict.fromkeys(PRIORITIES, 0)
+
+    def _queued(self) -> int:
+        return sum(len(w) for w in self._waiters.values())
+
+    def _can_start(self, priority: str) -> bool:
+        if sum(self.active.values()) >= self.max_active:
+            return False
+        return priority == PRIORITY_INTERACTIVE or self.active[priority] < self.max_active - self.interactive_reserved
+
+    def retry_after(self) -> int:
+        # Time for the queue ahead to drain through the active slots
+        backlog = self._queued() + 1
+        return max(1, round(self._service_ewma * backlog / self.max_active))
+
+    async def acquire(self, deadline=None, priority: str = None):
+        priority = priority or current_priority()
+        if self._can_start(priority) and not self._waiters[priority]:
+            self.active[priority] += 1
+            return time.monotonic()
+        if self._queued() >= self.max_queue:
+            self.rejected[priority] += 1
+            raise Overloaded(self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(waiter)
+        deadline = deadline or current_deadline()
+        try:
+            if deadline is None:
+                await waiter
+            else:
+                await asyncio.wait_for(asyncio.shield(waiter), deadline.remaining())
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot(priority)  # the slot arrived just as we gave up
+            else:
+                waiter.cancel()
+                if waiter in self._waiters[priority]:
+                    self._waiters[priority].remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected[priority] += 1
+                raise Overloaded(self.retry_after()) from None
+            raise
+        return time.monotonic()
+
+    def release(self, started: float, priority: str = None):
+        held = time.monotonic() - started
+        self._service_ewma = 0.8 * self._service_ewma + 0.2 * held
+        self._release_slot(priority or current_priority())
+
+    def _release_slot(self, priority: str):
+        # Hand the freed slot to the first waiter of the highest priority that may take it
+        self.active[priority] -= 1
+        for p in PRIORITIES:
+            waiters = self._waiters[p]
+            while waiters and self._can_start(p):
+                waiter = waiters.pop(0)
+                if not waiter.done():
+                    self.active[p] += 1
+                    waiter.set_result(None)
+                    return
+
+    def snapshot(self) -> dict:
+        return {
+            "active": dict(self.active),
+            "queued": {p: len(w) for p, w in self._waiters.items()},
+            "max_active": self.max_active,
+            "interactive_reserved": self.interactive_reserved,
+            "max_queue": self.max_queue,
+            "rejected": dict(self.rejected),
+            "avg_service_seconds": round(self._service_ewma, 2),
+        }
+
+ADMISSION = AdmissionController()
+
+class AdmissionMiddleware:
+    """
+    Holds an admission slot for the whole request (streamed bodies included) on
+    LLM routes, and sets the request's priority: `priorities[path]`, else bulk.
+    """
+
+    def __init__(self, app, paths, priorities: dict = None, controller: AdmissionController = ADMISSION):
+        self.app = app
+        self.paths = set(paths)
+        self.priorities = priorities or {}
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        # CORS preflights never reach an LLM: they must not take (or be refused) a slot
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+        priority = self.priorities.get(scope["path"], PRIORITY_BULK)
+        token = CURRENT_PRIORITY.set(priority)
+        try:
+            await self._admit(scope, receive, send, priority)
+        finally:
+            CURRENT_PRIORITY.reset(token)
+
+    async def _admit(self, scope, receive, send, priority: str):
+        try:
+            started = await self.controller.acquire(priority=priority)
+        except Overloaded as e:
+            body = json.dumps({"detail": str(e)}).encode()
+            await send({"type": "http.response.start", "status": 503, "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(e.retry_after).encode()),
+            ]})
+            await send({"type": "http.response.body", "body": body})
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(started, priority)
@@ -1,165 +1,21 @@
-import os
+import re
 import json
-import time
-from dotenv import load_dotenv
-from openai import OpenAI
-
-load_dotenv()
-
-# Parse API Keys (comma-separated support)
-api_keys_raw = os.getenv("OPENROUTER_API_KEY", "")
-API_KEYS = [k.strip() for k in api_keys_raw.split(",") if k.strip()]
-
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-if not API_KEYS:
-    print("Warning: OPENROUTER_API_KEY not found in environment variables.")
-
-# Priority list of models to try
-MODEL_CANDIDATES = [
-    "mistralai/mistral-7b-instruct:free",
-    "google/gemini-pro-1.5",
-    "openai/gpt-3.5-turbo",
-]
-
-# --- Helper Function ---
-def call_ai_json(system_prompt: str, user_prompt: str):
-    """Call OpenRouter with JSON enforcement and Key Rotation"""
-    
-    # Rotation Logic: Try every key
-    for key_idx, current_key in enumerate(API_KEYS):
-        # Initialize Client with current key
-        client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=current_key,
-        )
-        
-        # Try Models with this key
-        for model in MODEL_CANDIDATES:
-            try:
-                # print(f"Trying Key #{key_idx+1} | Model: {model}...") 
-                completion = client.chat.completions.create(
-                    model=model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt},
-                    ],
-                    response_format={"type": "json_object"}, 
-                )
-                content = completion.choices[0].message.content
-                
-                # Clean Markdown if present
-                if "```" in content:
-                    content = content.replace("```json", "").replace("```", "").strip()
-                
-                return json.loads(content)
-            
-            except Exception as e:
-                print(f"Failed (Key #{key_idx+1} | {model}): {e}")
-                continue # Try next model with same key OR next key if models exhausted for this key
-        
-        print(f"Key #{key_idx+1} exhausted all models. Switching to next key...")
-    
-    # Fallback if ALL keys fail
-    print("CRITICAL: All API keys and models failed.")
-    return {
-        "message": "System currently overloaded. Please try again later.",
-        "question": "What is next?",
-        "context_id": "error_fallback",
-        "next_question": "System Unavailable",
-        "style_feedback": {
-            "clarity": "N/A",
-            "confidence": "N/A",
-            "tips": ["System Error - Offline"]
-        }
-    }
-    
-    # Fallback / Mock Data System
-    with open("debug_agent.log", "a") as f:
-        f.write("All models failed. Attempting Mock Fallback.\n")
-    
-    # Mock for Interview Start
-    if "Technical Interviewer" in system_prompt and "Start" in system_prompt:
-        return {
-            "message": "Welcome to your Mock Interview (AI Unavailable). Let's begin!",
-            "question": "Could you explain the difference between a Process and a Thread?",
-            "context_id": "mock-123"
-        }
-    
-    # Mock for Interview Next
-    if "Technical Interviewer" in system_prompt and "Continue" in system_prompt:
-        return {
-             "feedback_internal": "Mock feedback: Good answer.",
-             "style_feedback": {
-                  "clarity": "High",
-                  "confidence": "Medium",
-                  "tips": ["Good use of terminology.", "Try to be more direct."]
-             },
-             "message": "That's correct. Moving on...",
-             "next_question": "How does memory management work in this context?"
-        }
-
-    # Mock for Interview Feedback
-    if "Hiring Manager" in system_prompt:
-        return {
-            "score": 85,
-            "communication_rating": "High",
-            "confidence_rating": "Medium",
-            "feedback": "This is a generated mock feedback because the AI service is currently unreachable. You demonstrated good knowledge.",
-            "ideal_answers": ["Thread shares memory, Process does not.", "GIL limits threads in Python."],
-            "improvement_suggestions": ["Deepen understanding of OS concepts.", "Practice concise explanations."]
-        }
-        
-    return {"error": "All AI models failed. Please try again later."}
-
-def call_ai_chat(history: list, message: str):
-    """Call OpenRouter for Chat (No JSON)"""
-    # Convert history format if needed, for now assume simple list
-    # OpenRouter expects {"role": "user/assistant", "content": "..."}
-    
-    messages = []
-    # Convert incompatible history if present (simple conversion)
-    try:
-        for h in history:
-            if "role" in h and "parts" in h: # Gemini format
-                role = "assistant" if h["role"] == "model" else "user"
-                # Safe access to parts
-                parts = h["parts"]
-                content = ""
-                if isinstance(parts, list):
-                    content = parts[0] if len(parts) > 0 else ""
-                else:
-                    content = str(parts)
-                
-                messages.append({"role": role, "content": content})
-            else:
-                messages.append(h)
-    except Exception as e:
-        print(f"Error processing history: {e}")
-            
-    messages.append({"role": "user", "content": message})
-
-    for key_idx, current_key in enumerate(API_KEYS):
-        # Initialize Client each time to rotate keys (or reuse if optimized, but here we recreate)
-        client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=current_key,
-        )
-
-        for model in MODEL_CANDIDATES:
-            try:
-                print(f"Trying chat model: {model} with Key #{key_idx+1}...")
-                completion = client.chat.completions.create(
-                    model=model,
-                    messages=messages
-                )
-                return completion.choices[0].message.content
-            except Exception as e:
-                print(f"Chat Model {model} failed with Key #{key_idx+1}: {e}")
-                continue
-            
-    print("CRITICAL: All chat models/keys failed.")
-    return "I'm having trouble connecting to my brain right now. Please try again."
+import asyncio
+from llm_gateway import API_KEYS, MODEL_CANDIDATES, call_ai_json, call_ai_chat, run_sync, stream_ai_chat, stream_ai_json_text, stream_ai_json, to_chat_messages
+from chat_context import CHAT_CONTEXT
+from prompt_format import compact_json, PROMPTS
+from prompt_cache import llm_agent
+from tracing import span
+from response_cache import CACHE_TTL
+from documents import ANALYSIS_CACHE, DOC_CACHE_TTL, content_hash
+from prompt_budget import (
+    CHARS_PER_TOKEN, RESUME_TOKEN_BUDGET, ASSESSMENT_CHUNK_TOKENS, ASSESSMENT_MAX_CHUNKS,
+    ASSESSMENT_MAX_TEXT_CHARS, ASSESSMENT_MAP_CONCURRENCY,
+    select_relevant_sections, chunk_text,
+)
+
+# All agents are coroutines. From a script, wrap them with run_sync, e.g.
+#   run_sync(generate_project_guide("Todo App", "FastAPI + React"))
 
 # --- Prompts ---
 
@@ -188,10 +44,11 @@ Return strictly valid JSON.
 
 # --- Agent Functions ---
 
-def generate_profile_insights(user_data: dict):
+@llm_agent("profile_insights")
+async def generate_profile_insights(user_data: dict):
     prompt = f"""
     Analyze this profile and provide insights:
-    {json.dumps(user_data, indent=2)}
+    {compact_json(user_data)}
     
     Structure response as JSON:
     {{
@@ -201,12 +58,13 @@ def generate_profile_insights(user_data: dict):
         "market_readiness": "High/Medium/Low - Reason"
     }}
     """
-    return call_ai_json(INSIGHTS_AGENT_PROMPT, prompt)
+    return await call_ai_json(INSIGHTS_AGENT_PROMPT, prompt)
 
-def generate_roadmap_ai(user_data: dict):
-    prompt = f"""
+def _roadmap_prompt(user_data: dict):
+    with span("prompt.build"):
+        return f"""
     Generate 3 distinct career options for:
-    {json.dumps(user_data, indent=2)}
+    {compact_json(user_data)}
     
     Structure the response as JSON:
     {{
@@ -228,10 +86,77 @@ def generate_roadmap_ai(user_data: dict):
         ]
     }}
     """
-    return call_ai_json(CAREER_AGENT_SYSTEM_PROMPT, prompt)
 
-def get_mentor_response(history: list, message: str):
-    return call_ai_chat(history, message)
+@llm_agent("roadmap")
+async def generate_roadmap_ai(user_data: dict):
+    return await call_ai_json(CAREER_AGENT_SYSTEM_PROMPT, _roadmap_prompt(user_data))
+
+@llm_agent("roadmap")
+def stream_roadmap_ai(user_data: dict):
+    """Yields ("item", option) per career option as it completes, then ("done", roadmap)"""
+    return stream_ai_json(CAREER_AGENT_SYSTEM_PROMPT, _roadmap_prompt(user_data), "options")
+
+CHAT_SUMMARY_PROMPT = """
+You keep the running notes of a career mentoring chat.
+Merge the existing notes with the new messages.
+
+Keep the user's goals, background, skills, constraints and decisions, plus any
+advice or plans the mentor already gave. Drop small talk. Stay under 200 words.
+
+Return strictly valid JSON:
+{
+  "summary": "..."
+}
+"""
+
+@llm_agent("chat_summary")
+async def summarize_chat(summary: str, messages: list):
+    """New running summary covering `summary` + `messages`, or None if the model failed"""
+    prompt = f"Existing Notes: {summary or 'None'}\nNew Messages: {json.dumps(messages)}"
+    result = await call_ai_json(CHAT_SUMMARY_PROMPT, prompt)
+    new_summary = result.get("summary") if isinstance(result, dict) else None
+    return new_summary if isinstance(new_summary, str) and new_summary.strip() else None
+
+@llm_agent("mentor_chat")
+async def get_mentor_response(history: list, message: str, hedge=None):
+    # Older turns travel as a running summary; it is refreshed after the reply
+    with span("prompt.build"):
+        messages = to_chat_messages(history)
+        context = await CHAT_CONTEXT.compact(messages)
+    reply = await call_ai_chat(context, message, hedge=hedge)
+    CHAT_CONTEXT.schedule_fold(messages, summarize_chat)
+    return reply
+
+@llm_agent("mentor_chat")
+async def stream_mentor_response(history: list, message: str):
+    with span("prompt.build"):
+        messages = to_chat_messages(history)
+        context = await CHAT_CONTEXT.compact(messages)
+    async for token in stream_ai_chat(context, message):
+        yield token
+    CHAT_CONTEXT.schedule_fold(messages, summarize_chat)
+
+# --- Multi-Agent Fan-out ---
+
+async def run_agents_concurrently(sub_agents: dict):
+    """
+    Schedule independent sub-agents in parallel.
+    sub_agents: {"section": agent_coroutine(...), ...}
+    Returns (results, errors): one failing section never sinks the others.
+    """
+    names = list(sub_agents)
+    outcomes = await asyncio.gather(*sub_agents.values(), return_exceptions=True)
+
+    results, errors = {}, {}
+    for name, outcome in zip(names, outcomes):
+        if isinstance(outcome, BaseException):
+            print(f"Sub-agent '{name}' raised: {outcome!r}")
+            errors[name] = str(outcome) or type(outcome).__name__
+        elif isinstance(outcome, dict) and "error" in outcome:
+            errors[name] = outcome["error"]
+        else:
+            results[name] = outcome
+    return results, errors
 
 # --- Phase 3 Agents ---
 
@@ -282,29 +207,42 @@ Return strict JSON:
 }
 """
 
-def generate_job_recommendations(user_data: dict, career_path: str):
+@llm_agent("job_recommendations")
+async def generate_job_recommendations(user_data: dict, career_path: str):
     prompt = f"""
-    User Profile: {json.dumps(user_data)}
+    User Profile: {compact_json(user_data)}
     Selected Career Path: {career_path}
     Generate 3 relevant job postings.
     """
-    return call_ai_json(JOB_AGENT_PROMPT, prompt)
+    return await call_ai_json(JOB_AGENT_PROMPT, prompt)
 
-def generate_course_recommendations(user_data: dict, career_path: str):
+@llm_agent("course_recommendations")
+async def generate_course_recommendations(user_data: dict, career_path: str):
     prompt = f"""
-    User Profile: {json.dumps(user_data)}
+    User Profile: {compact_json(user_data)}
     Selected Career Path: {career_path}
     Generate 3 course recommendations to bridge skill gaps.
     """
-    return call_ai_json(COURSE_AGENT_PROMPT, prompt)
-
-def analyze_resume_text(resume_text: str, career_goal: str = "General Tech Role"):
-    prompt = f"""
+    return await call_ai_json(COURSE_AGENT_PROMPT, prompt)
+
+# Most document text each agent can make use of; PDF extraction stops here.
+# What actually reaches the model is decided by the token budgets in prompt_budget.
+RESUME_TEXT_LIMIT = RESUME_TOKEN_BUDGET * CHARS_PER_TOKEN * 4
+ASSESSMENT_TEXT_LIMIT = ASSESSMENT_MAX_TEXT_CHARS
+
+@llm_agent("resume_analysis")
+async def analyze_resume_text(resume_text: str, career_goal: str = "General Tech Role"):
+    with span("prompt.build", chars=len(resume_text)):
+        # Over budget: keep skills/experience and goal-relevant sections rather than the first N chars
+        resume_text = select_relevant_sections(resume_text, RESUME_TOKEN_BUDGET, focus=career_goal)
+        prompt = f"""
     Target Role/Goal: {career_goal}
     Resume Content:
-    {resume_text[:10000]} 
+    {resume_text} 
     """
-    return call_ai_json(RESUME_AGENT_PROMPT, prompt)
+        # Re-uploads of the same resume for the same goal reuse the earlier analysis
+        analysis_key = f"{content_hash(resume_text)}:{career_goal}"
+    return await call_ai_json(RESUME_AGENT_PROMPT, prompt, cache_ttl=DOC_CACHE_TTL, cache_key=analysis_key, cache=ANALYSIS_CACHE)
 
 MARKET_AGENT_PROMPT = """
 You are a Career Market Analyst.
@@ -332,14 +270,15 @@ Return strict JSON:
 }
 """
 
-def generate_market_insights(target_role: str, skills: list, location: str):
+@llm_agent("market_insights")
+async def generate_market_insights(target_role: str, skills: list, location: str):
     prompt = f"""
     Target Role: {target_role}
     Current Skills: {", ".join(skills)}
     Location: {location}
     analyze market readiness.
     """
-    return call_ai_json(MARKET_AGENT_PROMPT, prompt)
+    return await call_ai_json(MARKET_AGENT_PROMPT, prompt, cache_ttl=CACHE_TTL)
 
 JOB_PREP_AGENT_PROMPT = """
 You are a Tech Career Coach.
@@ -358,14 +297,15 @@ Return strict JSON:
 }
 """
 
-def generate_job_prep(job_title: str, company: str, skills: list):
+@llm_agent("job_prep")
+async def generate_job_prep(job_title: str, company: str, skills: list):
     prompt = f"""
     Job Title: {job_title}
     Company: {company}
     My Skills: {", ".join(skills)}
     Create a prep guide.
     """
-    return call_ai_json(JOB_PREP_AGENT_PROMPT, prompt)
+    return await call_ai_json(JOB_PREP_AGENT_PROMPT, prompt, cache_ttl=CACHE_TTL)
 
 PROJECT_AGENT_PROMPT = """
 You are a Senior Tech Lead.
@@ -380,12 +320,13 @@ Return strict JSON:
 }
 """
 
-def generate_project_guide(title: str, description: str):
+@llm_agent("project_guide")
+async def generate_project_guide(title: str, description: str):
     prompt = f"""
     Project: {title}
     Context: {description}
     """
-    return call_ai_json(PROJECT_AGENT_PROMPT, prompt)
+    return await call_ai_json(PROJECT_AGENT_PROMPT, prompt, cache_ttl=CACHE_TTL)
 
 RESUME_BUILDER_PROMPT = """
 Act as a Resume Writer.
@@ -405,11 +346,12 @@ Return strict JSON:
 }
 """
 
-def generate_resume_content(user_data: dict):
+@llm_agent("resume_builder")
+async def generate_resume_content(user_data: dict):
     prompt = f"""
-    User Data: {user_data}
+    User Data: {compact_json(user_data)}
     """
-    response = call_ai_json(RESUME_BUILDER_PROMPT, prompt)
+    response = await call_ai_json(RESUME_BUILDER_PROMPT, prompt)
     
     # Simple Fallback if NULL or Error
     if not response or "error" in response:
@@ -444,6 +386,7 @@ Requirements:
 - Provide 4 options per question.
 - Indicate the index of the correct option (0-3).
 - Include a brief explanation for the correct answer.
+- Tag each question with the sub-topic/concept it tests.
 
 Return strictly valid JSON:
 {
@@ -452,6 +395,7 @@ Return strictly valid JSON:
       "id": 1,
       "scenario": "...",
       "question": "...",
+      "topic": "Sub-topic/concept this question tests",
       "options": ["A", "B", "C", "D"],
       "correct_index": 2,
       "explanation": "..."
@@ -460,57 +404,110 @@ Return strictly valid JSON:
 }
 """
 
-def generate_assessment_quiz(topic: str, difficulty: str, count: int = 5):
-    prompt = f"""
+def _assessment_quiz_prompt(topic: str, difficulty: str, count: int):
+    return f"""
     Topic: {topic}
     Difficulty: {difficulty}
     Count: {count}
     """
-    return call_ai_json(ASSESSMENT_GEN_PROMPT, prompt)
 
+@llm_agent("assessment_quiz")
+async def generate_assessment_quiz(topic: str, difficulty: str, count: int = 5):
+    return await call_ai_json(ASSESSMENT_GEN_PROMPT, _assessment_quiz_prompt(topic, difficulty, count), cache_ttl=CACHE_TTL)
+
+@llm_agent("assessment_quiz")
+def stream_assessment_quiz(topic: str, difficulty: str, count: int = 5):
+    """Yields ("item", question) per quiz question as it completes, then ("done", quiz)"""
+    return stream_ai_json(ASSESSMENT_GEN_PROMPT, _assessment_quiz_prompt(topic, difficulty, count), "questions", cache_ttl=CACHE_TTL)
+
+# Scoring is done locally (score_assessment); the LLM only writes the narrative
 ASSESSMENT_EVAL_PROMPT = """
 You are a Senior Mentor.
-Evaluate the user's quiz performance.
+The user's quiz has already been graded. Using the score, weak areas and missed questions provided:
 
 Output Requirements:
-1. Calculate score (0-100).
-2. Identify specific sub-topics/concepts the user is weak in based on wrong answers.
-3. Recommend 3 specific learning resources (docs/courses) for those weak areas.
-4. Provide a supportive but constructive summary.
+1. Recommend 3 specific learning resources (docs/courses) for those weak areas.
+2. Provide a supportive but constructive summary.
 
 Return strictly valid JSON:
 {
-  "score": 80,
   "summary": "...",
-  "weak_areas": ["...", "..."],
   "recommendations": [
     { "title": "...", "type": "Article/Course", "link": "..." }
   ]
 }
 """
 
-def evaluate_assessment_results(topic: str, user_answers: list, quiz_data: list):
+def score_assessment(topic: str, user_answers: list, quiz_data: list):
+    """
+    Grade a quiz against each question's correct_index, without an LLM.
+    user_answers: [{"question_id": 1, "selected_index": 2}, ...]
+    """
+    selected = {a.get("question_id"): a.get("selected_index") for a in user_answers}
+    results = []
+    missed_topics = {}
+    for i, q in enumerate(quiz_data, start=1):
+        qid = q.get("id", i)
+        choice = selected.get(qid)
+        correct = choice is not None and choice == q.get("correct_index")
+        results.append({
+            "question_id": qid,
+            "selected_index": choice,
+            "correct_index": q.get("correct_index"),
+            "correct": correct,
+        })
+        if not correct:
+            area = q.get("topic") or topic
+            missed_topics[area] = missed_topics.get(area, 0) + 1
+
+    correct_count = sum(r["correct"] for r in results)
+    total = len(results)
+    return {
+        "score": round(100 * correct_count / total) if total else 0,
+        "correct": correct_count,
+        "total": total,
+        "results": results,
+        # Most-missed first
+        "weak_areas": sorted(missed_topics, key=lambda area: -missed_topics[area]),
+        "weak_area_counts": missed_topics,
+    }
+
+@llm_agent("assessment_narrative")
+async def generate_assessment_narrative(topic: str, graded: dict, quiz_data: list):
+    """Summary + resources for an already graded quiz; only missed questions are sent"""
+    missed_ids = {r["question_id"] for r in graded["results"] if not r["correct"]}
+    missed = [
+        {"question": q.get("question"), "topic": q.get("topic"), "explanation": q.get("explanation")}
+        for i, q in enumerate(quiz_data, start=1)
+        if q.get("id", i) in missed_ids
+    ]
     prompt = f"""
     Topic: {topic}
-    Quiz Data: {json.dumps(quiz_data)}
-    User Answers: {json.dumps(user_answers)}
+    Score: {graded["score"]} ({graded["correct"]}/{graded["total"]} correct)
+    Weak Areas: {", ".join(graded["weak_areas"]) or "None"}
+    Missed Questions: {json.dumps(missed)}
     """
-    return call_ai_json(ASSESSMENT_EVAL_PROMPT, prompt)
+    return await call_ai_json(ASSESSMENT_EVAL_PROMPT, prompt)
 
+async def evaluate_assessment_results(topic: str, user_answers: list, quiz_data: list):
+    """Local grading plus the LLM narrative in one result (scripts; the API returns them separately)"""
+    graded = score_assessment(topic, user_answers, quiz_data)
+    narrative = await generate_assessment_narrative(topic, graded, quiz_data)
+    return {**graded, "summary": narrative.get("summary"), "recommendations": narrative.get("recommendations", [])}
 
+
+# Static system prompt; the study material goes in the user message (ASSESSMENT_FROM_TEXT_USER)
 ASSESSMENT_FROM_TEXT_PROMPT = """
 You are a Technical Interviewer.
 Generate a skill assessment quiz based STRICTLY on the provided text context.
 
-Context:
-{context_text}
-
 Requirements:
-- Generate {count} questions derived from the text.
+- Generate the requested number of questions, derived from the text.
 - Questions must test understanding of the provided content.
 - Provide 4 options per question.
 - Indicate the index of the correct option (0-3).
 - Include a brief explanation.
+- Tag each question with the sub-topic/concept it tests.
 
 Return strictly valid JSON:
 {
@@ -519,6 +516,7 @@ Return strictly valid JSON:
       "id": 1,
       "scenario": "...",
       "question": "...",
+      "topic": "Sub-topic/concept this question tests",
       "options": ["A", "B", "C", "D"],
       "correct_index": 2,
       "explanation": "..."
@@ -527,18 +525,95 @@ Return strictly valid JSON:
 }
 """
 
-def generate_assessment_from_text(text_content: str, count: int = 10):
-    # Truncate text to avoid token limits if necessary (e.g. 15k chars)
-    truncated_text = text_content[:15000]
-    
-    prompt = f"""
-    Generate {count} questions based on the above context.
+ASSESSMENT_FROM_TEXT_USER = PROMPTS.register("assessment_from_text_user", """
+Context:
+{context_text}
+
+Generate {count} questions based on the above context.
+""")
+
+@llm_agent("assessment_from_text")
+async def _assessment_from_chunk(chunk: str, count: int):
+    prompt = ASSESSMENT_FROM_TEXT_USER.render(context_text=chunk, count=count)
+    return await call_ai_json(ASSESSMENT_FROM_TEXT_PROMPT, prompt)
+
+_STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "of", "in", "on", "to", "for", "and", "or",
+    "what", "which", "how", "why", "when", "does", "do", "s", "it", "this", "that", "with", "by", "as",
+}
+
+def _question_words(question: dict) -> set:
+    words = re.findall(r"[a-z0-9+#]+", str(question.get("question", "")).lower())
+    # Crude plural folding so "lists"/"list" compare equal
+    return {w[:-1] if len(w) > 3 and w.endswith("s") else w for w in words if w not in _STOPWORDS}
+
+def _is_near_duplicate(words: set, kept: list, threshold: float = 0.8) -> bool:
+    # Jaccard overlap of question wording; catches rephrasings of the same question
+    for other in kept:
+        union = len(words | other)
+        if union and len(words & other) / union >= threshold:
+            return True
+    return False
+
+def reduce_assessment_questions(section_results: list, count: int):
     """
-    
-    # Pre-fill the system prompt with the context to keep it focused
-    system_prompt = ASSESSMENT_FROM_TEXT_PROMPT.replace("{context_text}", truncated_text).replace("{count}", str(count))
-    
-    return call_ai_json(system_prompt, prompt)
+    Reduce step: drop near-duplicate questions across sections, then pick
+    `count` questions round-robin over sections so the quiz covers the
+    whole document rather than its first pages.
+    """
+    kept_words = []
+    per_section = []
+    for result in section_results:
+        unique = []
+        for q in result.get("questions") or []:
+            words = _question_words(q)
+            if not words or _is_near_duplicate(words, kept_words):
+                continue
+            kept_words.append(words)
+            unique.append(q)
+        per_section.append(unique)
+
+    picked = []
+    depth = 0
+    while len(picked) < count and any(depth < len(qs) for qs in per_section):
+        for qs in per_section:
+            if depth < len(qs) and len(picked) < count:
+                picked.append(qs[depth])
+        depth += 1
+
+    if not picked:
+        return section_results[0]  # every section failed: surface the first failure as before
+    for i, q in enumerate(picked, start=1):
+        q["id"] = i
+    return {"questions": picked}
+
+async def map_reduce_assessment(sections: list, count: int):
+    """Map: quiz each section concurrently (capped). Reduce: de-duplicate and spread picks across sections."""
+    limit = asyncio.Semaphore(ASSESSMENT_MAP_CONCURRENCY)
+    # Oversample so the reduce step has room to drop duplicates and still fill `count`
+    per_section = max(2, -(-count * 3 // (2 * len(sections))))
+
+    async def map_section(section: str):
+        async with limit:
+            return await _assessment_from_chunk(section, per_section)
+
+    results = await asyncio.gather(*(map_section(s) for s in sections))
+    return reduce_assessment_questions(results, count)
+
+async def generate_assessment_from_text(text_content: str, count: int = 10, mode: str = "auto"):
+    """
+    mode="auto": one call for short material, map-reduce over sections for long material.
+    mode="single": one call over the first chunk only (the pre-map-reduce behaviour).
+    mode="map_reduce": always split into sections.
+    """
+    with span("prompt.build", chars=len(text_content)) as s:
+        sections = chunk_text(text_content, ASSESSMENT_CHUNK_TOKENS, ASSESSMENT_MAX_CHUNKS)
+        if not sections:
+            sections = [text_content]
+        s.set_attribute("sections", len(sections))
+    if mode == "single" or (mode == "auto" and len(sections) == 1):
+        return await _assessment_from_chunk(sections[0], count)
+    return await map_reduce_assessment(sections, count)
 
 # --- Interview Module Agents ---
 
@@ -549,10 +624,11 @@ PERSONA_PROMPTS = {
     "Socratic": "You are a wise Mentor using the Socratic method. NEVER give the answer. Ask 'Why?' and 'How?' recursively to guide the user to the solution."
 }
 
-INTERVIEW_START_PROMPT = """
-{persona_instruction}
-Start an interview for the role: {role}.
-Focus: {type} (Technical/Behavioral).
+# Interview system prompts: static instructions first, the persona (one of
+# PERSONA_PROMPTS) last; role and answers go in the user message.
+INTERVIEW_START_PROMPT = PROMPTS.register("interview_start", """
+Start an interview for the given role.
+The focus is Technical or Behavioral, as given.
 
 Generate the first welcoming message and the FIRST question.
 The question should be relevant to the role and focus.
@@ -563,20 +639,23 @@ Return strictly valid JSON:
   "question": "First question...",
   "context_id": "unique_id_if_needed"
 }
-"""
 
-def start_interview(role: str, focus: str, persona: str = "Friendly"):
+Interviewer Persona:
+{persona_instruction}
+""")
+
+INTERVIEW_START_USER = PROMPTS.register("interview_start_user", "Role: {role}\nFocus: {focus}")
+
+@llm_agent("interview_start")
+async def start_interview(role: str, focus: str, persona: str = "Friendly", hedge=None):
     persona_instr = PERSONA_PROMPTS.get(persona, PERSONA_PROMPTS["Friendly"])
-    prompt = f"Role: {role}\nFocus: {focus}"
-    system = INTERVIEW_START_PROMPT.replace("{role}", role).replace("{type}", focus).replace("{persona_instruction}", persona_instr)
-    return call_ai_json(system, prompt)
+    system = INTERVIEW_START_PROMPT.render(persona_instruction=persona_instr)
+    prompt = INTERVIEW_START_USER.render(role=role, focus=focus)
+    return await call_ai_json(system, prompt, hedge=hedge)
 
-INTERVIEW_NEXT_PROMPT = """
-{persona_instruction}
-Continue the interview.
-Current Role: {role}
-Previous Question: {last_question}
-User Answer: {user_answer}
+INTERVIEW_NEXT_PROMPT = PROMPTS.register("interview_next", """
+Continue the interview for the given role.
+You are given the previous question and the user's answer.
 
 Analyze the user's answer.
 1. valid/good?
@@ -602,14 +681,45 @@ Return strictly valid JSON:
   "message": "Transition phrase (e.g. 'Good point regarding X...')",
   "next_question": "The actual next question"
 }
-"""
 
-def next_interview_question(role: str, history: list, last_question: str, user_answer: str, persona: str = "Friendly"):
-    persona_instr = PERSONA_PROMPTS.get(persona, PERSONA_PROMPTS["Friendly"])
-    prompt = f"Role: {role}\nPrevious Question: {last_question}\nUser Answer: {user_answer}"
-    system = INTERVIEW_NEXT_PROMPT.replace("{role}", role).replace("{last_question}", last_question).replace("{user_answer}", user_answer).replace("{persona_instruction}", persona_instr)
-    
-    return call_ai_json(system, prompt)
+Interviewer Persona:
+{persona_instruction}
+""")
+
+INTERVIEW_NEXT_USER = PROMPTS.register("interview_next_user", "{context}Role: {role}\nPrevious Question: {last_question}\nUser Answer: {user_answer}")
+
+def format_interview_context(summary: str, turns: list) -> str:
+    """Bounded view of the interview so far: rolling summary + latest turns verbatim"""
+    parts = []
+    if summary:
+        parts.append(f"Earlier in the interview (summary): {summary}")
+    if turns:
+        parts.append(f"Recent Turns: {json.dumps(turns)}")
+    return "\n".join(parts)
+
+def _next_interview_prompts(role: str, last_question: str, user_answer: str, persona: str, context: str = ""):
+    with span("prompt.build"):
+        persona_instr = PERSONA_PROMPTS.get(persona, PERSONA_PROMPTS["Friendly"])
+        system = INTERVIEW_NEXT_PROMPT.render(persona_instruction=persona_instr)
+        prompt = INTERVIEW_NEXT_USER.render(
+            context=f"{context}\n" if context else "",
+            role=role,
+            last_question=last_question,
+            user_answer=user_answer,
+        )
+    return system, prompt
+
+@llm_agent("interview_next")
+async def next_interview_question(role: str, history: list, last_question: str, user_answer: str, persona: str = "Friendly", hedge=None, context: str = ""):
+    # context: format_interview_context(...) of a server-side session, if any
+    system, prompt = _next_interview_prompts(role, last_question, user_answer, persona, context)
+    return await call_ai_json(system, prompt, hedge=hedge)
+
+@llm_agent("interview_next")
+def stream_next_interview_question(role: str, history: list, last_question: str, user_answer: str, persona: str = "Friendly", context: str = ""):
+    """Raw JSON deltas of the next-question response, for the SSE endpoint"""
+    system, prompt = _next_interview_prompts(role, last_question, user_answer, persona, context)
+    return stream_ai_json_text(system, prompt)
 
 INTERVIEW_FEEDBACK_PROMPT = """
 You are a Hiring Manager.
@@ -629,7 +739,35 @@ Output Requirements:
 Return strictly valid JSON.
 """
 
-def end_interview(role: str, history: list):
+@llm_agent("interview_feedback")
+async def end_interview(role: str, history: list, summary: str = ""):
     # History format: [{question: "", answer: ""}, ...]
-    prompt = f"Role: {role}\nHistory: {json.dumps(history)}"
-    return call_ai_json(INTERVIEW_FEEDBACK_PROMPT, prompt)
+    # summary: rolling summary of turns no longer in history (server-side sessions)
+    prompt = f"Role: {role}\n"
+    if summary:
+        prompt += f"Summary of Earlier Turns: {summary}\n"
+    prompt += f"History: {json.dumps(history)}"
+    return await call_ai_json(INTERVIEW_FEEDBACK_PROMPT, prompt)
+
+INTERVIEW_SUMMARY_PROMPT = """
+You keep the running notes of a job interview.
+Merge the existing notes with the new question/answer turns.
+
+Keep, for every question asked: the question itself (briefly), how well it was answered,
+and notable strengths, gaps or misconceptions. The notes are later used to score the
+candidate and to write ideal answers for the hardest questions, so do not drop questions.
+Stay under 250 words.
+
+Return strictly valid JSON:
+{
+  "summary": "..."
+}
+"""
+
+@llm_agent("interview_summary")
+async def summarize_interview_turns(role: str, summary: str, turns: list):
+    """New rolling summary covering `summary` + `turns`, or None if the model failed"""
+    prompt = f"Role: {role}\nExisting Notes: {summary or 'None'}\nNew Turns: {json.dumps(turns)}"
+    result = await call_ai_json(INTERVIEW_SUMMARY_PROMPT, prompt)
+    new_summary = result.get("summary") if isinstance(result, dict) else None
+    return new_summary if isinstance(new_summary, str) and new_summary.strip() else None
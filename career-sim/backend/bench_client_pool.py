@@ -0,0 +1,117 @@
+"""
+Benchmark: fresh AsyncOpenAI per call vs pooled ClientRegistry.
+
+Spins up a local mock OpenRouter (/chat/completions) and fires the same
+workload through both strategies, printing p50/p99 latency.
+
+    python bench_client_pool.py --requests 300 --concurrency 20 --latency-ms 20
+    python bench_client_pool.py --tls-cert cert.pem --tls-key key.pem   # include TLS handshakes
+"""
+import argparse
+import asyncio
+import json
+import ssl
+import statistics
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from llm_clients import ClientRegistry
+
+MOCK_RESPONSE = {
+    "id": "bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "mock",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "{\"ok\": true}"}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 3, "total_tokens": 13},
+}
+
+def start_mock_server(latency_ms: float, cert: str = None, key: str = None):
+    body = json.dumps(MOCK_RESPONSE).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(latency_ms / 1000)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    scheme = "http"
+    if cert and key:
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ctx.load_cert_chain(cert, key)
+        server.socket = ctx.wrap_socket(server.socket, server_side=True)
+        scheme = "https"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"{scheme}://127.0.0.1:{server.server_address[1]}/api/v1"
+
+async def one_call(client):
+    await client.chat.completions.create(
+        model="mock",
+        messages=[{"role": "user", "content": "ping"}],
+    )
+
+async def run(strategy: str, base_url: str, n: int, concurrency: int, verify):
+    registry = ClientRegistry(base_url, ["bench-key"], http_options={"verify": verify})
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def task():
+        async with sem:
+            start = time.perf_counter()
+            if strategy == "fresh":
+                # Old behaviour: new client (and connection pool) per request
+                client = AsyncOpenAI(base_url=base_url, api_key="bench-key", http_client=DefaultAsyncHttpxClient(verify=verify))
+                try:
+                    await one_call(client)
+                finally:
+                    await client.close()
+            else:
+                await one_call(registry.get("bench-key"))
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    wall = time.perf_counter()
+    await asyncio.gather(*(task() for _ in range(n)))
+    wall = time.perf_counter() - wall
+    await registry.aclose()
+    return latencies, wall
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--tls-cert")
+    parser.add_argument("--tls-key")
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(args.latency_ms, args.tls_cert, args.tls_key)
+    # Self-signed bench certs are not in the CA bundle
+    verify = False if args.tls_cert else True
+
+    print(f"Mock OpenRouter at {base_url} ({args.latency_ms}ms upstream latency)")
+    print(f"{args.requests} requests, concurrency {args.concurrency}\n")
+    print(f"{'strategy':<8} {'p50 ms':>8} {'p99 ms':>8} {'mean ms':>8} {'req/s':>8}")
+    for strategy in ("fresh", "pooled"):
+        latencies, wall = asyncio.run(run(strategy, base_url, args.requests, args.concurrency, verify))
+        print(f"{strategy:<8} {percentile(latencies, 50):>8.1f} {percentile(latencies, 99):>8.1f} "
+              f"{statistics.mean(latencies):>8.1f} {args.requests / wall:>8.1f}")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Report prompt tokens per endpoint: the old profile embedding (indented JSON /
+dict repr, every default field) vs the compact serializer.
+
+Agent prompts are captured by stubbing the LLM call, so no API key is needed.
+
+    python bench_prompt_tokens.py
+"""
+import asyncio
+import json
+
+import agents
+from main import CareerInput, ResumeBuildRequest
+from prompt_format import compact_json, prune
+from prompt_budget import prompt_tokens
+
+# A typical wizard submission: optional fields left out
+SAMPLE_PROFILE = {
+    "academics": {"education_level": "Undergraduate", "stream": "Science", "branch": "Computer Science", "cgpa": 8.1},
+    "profile": {"name": "Asha", "age": 20, "skills": ["Python", "SQL", "React"], "interests": ["AI", "Web Development"]},
+    "goals": {"long_term_goal": "Become an ML engineer", "preferred_location": "Bangalore"},
+}
+SAMPLE_RESUME = {
+    "name": "Asha", "email": "asha@example.com", "phone": "",
+    "experience": "Intern at Acme (2024): built dashboards", "education": "B.Tech CSE", "skills": "Python, SQL",
+}
+
+async def capture(agent, *args):
+    """(system, user) prompt the agent would send"""
+    seen = {}
+
+    async def fake_call(system_prompt, user_prompt, **kwargs):
+        seen["prompt"] = (system_prompt, user_prompt)
+        return {}
+
+    original = agents.call_ai_json
+    agents.call_ai_json = fake_call
+    try:
+        await agent(*args)
+    finally:
+        agents.call_ai_json = original
+    return seen["prompt"]
+
+async def run():
+    career = CareerInput(**SAMPLE_PROFILE)
+    resume = ResumeBuildRequest(**SAMPLE_RESUME)
+    full, lean = career.dict(), career.dict(exclude_unset=True)
+    rec_lean = prune(full)
+
+    cases = [
+        # endpoint, agent call, old embedding, new embedding
+        ("/api/generate-insights", (agents.generate_profile_insights, lean), json.dumps(full, indent=2), compact_json(lean)),
+        ("/api/generate-roadmap", (agents.generate_roadmap_ai, lean), json.dumps(full, indent=2), compact_json(lean)),
+        ("/api/recommendations (jobs)", (agents.generate_job_recommendations, rec_lean, "ML Engineer"), json.dumps(full), compact_json(rec_lean)),
+        ("/api/recommendations (courses)", (agents.generate_course_recommendations, rec_lean, "ML Engineer"), json.dumps(full), compact_json(rec_lean)),
+        ("/api/build-resume", (agents.generate_resume_content, resume.dict()), str(resume.dict()), compact_json(resume.dict())),
+    ]
+
+    print(f"{'endpoint':<32} {'before':>7} {'after':>7} {'saved':>7}")
+    for endpoint, (agent, *args), old, new in cases:
+        system, user = await capture(agent, *args)
+        after = prompt_tokens(system, user)
+        before = after - prompt_tokens(new) + prompt_tokens(old)
+        print(f"{endpoint:<32} {before:>7} {after:>7} {100 * (before - after) / before:>6.1f}%")
+
+if __name__ == "__main__":
+    asyncio.run(run())
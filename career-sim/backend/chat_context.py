@@ -0,0 +1,85 @@
+import os
+import json
+import hashlib
+from response_cache import make_cache, normalize_prompt, CACHE_BACKEND
+from deadlines import spawn_background
+
+# --- Chat Context ---
+# The mentor chat is stateless: the client posts the whole history every time.
+# Only the latest turns are forwarded verbatim; older messages are replaced by a
+# running summary. Summaries are computed in the background after a reply and
+# cached under a hash of the messages they cover, so the next request (which
+# repeats that same prefix) finds them.
+CHAT_RECENT_TURNS = int(os.getenv("CHAT_RECENT_TURNS", "4"))  # user+assistant pairs kept verbatim
+# Summaries cover prefixes in multiples of this many messages (one summary call per batch)
+CHAT_FOLD_BATCH = int(os.getenv("CHAT_FOLD_BATCH_MESSAGES", "4"))
+CHAT_SUMMARY_MAX_ENTRIES = int(os.getenv("CHAT_SUMMARY_MAX_ENTRIES", "2048"))
+CHAT_SUMMARY_TTL = float(os.getenv("CHAT_SUMMARY_TTL", str(24 * 3600)))
+
+def prefix_hashes(messages: list) -> list:
+    """hashes[i] identifies messages[:i]; chained so the whole list costs one pass"""
+    hashes = [""]
+    for m in messages:
+        entry = json.dumps([hashes[-1], m.get("role"), normalize_prompt(str(m.get("content", "")))])
+        hashes.append(hashlib.sha256(entry.encode("utf-8")).hexdigest())
+    return hashes
+
+def fold_point(message_count: int) -> int:
+    """How many leading messages should be covered by the summary"""
+    older = message_count - 2 * CHAT_RECENT_TURNS
+    return max(0, older // CHAT_FOLD_BATCH * CHAT_FOLD_BATCH)
+
+class ChatContext:
+    def __init__(self, cache=None):
+        self._cache = cache or make_cache("chat_summary", CHAT_SUMMARY_MAX_ENTRIES, CHAT_SUMMARY_TTL, backend=CACHE_BACKEND)
+        self._folding = {}  # prefix hash -> background summary task
+
+    async def _latest_summary(self, hashes: list, upto: int):
+        """(k, summary) for the longest summarized prefix of length <= upto, or (0, None)"""
+        # Probes are uncounted: one request may try several prefixes before it finds one
+        for k in range(upto, 0, -CHAT_FOLD_BATCH):
+            summary = await self._cache.peek(hashes[k])
+            if summary is not None:
+                return k, summary
+        return 0, None
+
+    async def compact(self, messages: list) -> list:
+        """Replace the summarized prefix of `messages` (OpenRouter format) with one system message"""
+        upto = fold_point(len(messages))
+        if upto == 0:
+            return messages  # short chat: nothing to look up
+        k, summary = await self._latest_summary(prefix_hashes(messages), upto)
+        self._cache.record_lookup(summary is not None)
+        if summary is None:
+            return messages
+        return [{"role": "system", "content": f"Summary of the earlier conversation: {summary}"}] + messages[k:]
+
+    def schedule_fold(self, messages: list, summarize):
+        """
+        Summarize everything before the verbatim window in the background.
+        summarize(previous_summary, messages) -> new summary text, or None to retry on a later turn.
+        """
+        target = fold_point(len(messages))
+        if target == 0:
+            return
+        hashes = prefix_hashes(messages)
+        key = hashes[target]
+        if key in self._folding:
+            return
+        task = spawn_background(self._fold(messages, hashes, target, summarize))
+        self._folding[key] = task
+        task.add_done_callback(lambda _: self._folding.pop(key, None))
+
+    async def _fold(self, messages: list, hashes: list, target: int, summarize):
+        if await self._cache.peek(hashes[target]) is not None:
+            return  # an earlier turn already summarized this prefix
+        k, summary = await self._latest_summary(hashes, target - CHAT_FOLD_BATCH)
+        try:
+            new_summary = await summarize(summary, messages[k:target])
+        except Exception as e:
+            print(f"Chat summary failed: {e}")
+            return
+        if new_summary:
+            await self._cache.set(hashes[target], new_summary)
+
+CHAT_CONTEXT = ChatContext()
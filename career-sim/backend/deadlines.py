@@ -0,0 +1,103 @@
+import os
+import time
+import asyncio
+import contextvars
+
+# --- Request Deadlines ---
+# Every request gets a time budget (set per endpoint in main.py). Upstream
+# attempts only get what is left of it, and the key/model fallback chain stops
+# once it is spent, instead of trying every pair with the client's default timeout.
+DEFAULT_DEADLINE = float(os.getenv("LLM_DEFAULT_DEADLINE", "60"))
+# Work that outlives its request (narratives, summaries) gets its own budget
+BACKGROUND_DEADLINE = float(os.getenv("LLM_BACKGROUND_DEADLINE", "120"))
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before an upstream attempt succeeded"""
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        super().__init__(f"The AI service did not respond within {budget:g}s. Please try again.")
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.budget = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self):
+        if self.expired:
+            raise DeadlineExceeded(self.budget)
+
+    async def run(self, awaitable):
+        """Await with the remaining budget; DeadlineExceeded (and cancellation) once it runs out"""
+        remaining = self.remaining()
+        if remaining <= 0:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise DeadlineExceeded(self.budget)
+        try:
+            return await asyncio.wait_for(awaitable, remaining)
+        except asyncio.TimeoutError:
+            if self.expired:
+                raise DeadlineExceeded(self.budget) from None
+            raise
+
+CURRENT_DEADLINE = contextvars.ContextVar("request_deadline", default=None)
+
+def current_deadline():
+    return CURRENT_DEADLINE.get()
+
+async def within(deadline, awaitable):
+    """`await awaitable`, bounded by deadline when there is one"""
+    if deadline is None:
+        return await awaitable
+    return await deadline.run(awaitable)
+
+# --- Request Priority ---
+# Conversational turns (someone is waiting on the next message) outrank bulk
+# generations when upstream capacity is short; see admission.py. Set per
+# endpoint by AdmissionMiddleware; calls made outside a request count as interactive.
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BULK)  # highest first
+
+CURRENT_PRIORITY = contextvars.ContextVar("request_priority", default=PRIORITY_INTERACTIVE)
+
+def current_priority() -> str:
+    return CURRENT_PRIORITY.get()
+
+async def _with_deadline(coro, seconds: float):
+    # Runs in the new task's own copy of the context, so the request keeps its deadline
+    CURRENT_DEADLINE.set(Deadline(seconds))
+    CURRENT_PRIORITY.set(PRIORITY_BULK)
+    return await coro
+
+def spawn_background(coro, seconds: float = BACKGROUND_DEADLINE) -> asyncio.Task:
+    """
+    create_task for work that outlives the request: it gets a fresh deadline
+    instead of the request's, and runs at bulk priority (nobody is waiting on it).
+    """
+    return asyncio.create_task(_with_deadline(coro, seconds))
+
+class DeadlineMiddleware:
+    """Starts each HTTP request's Deadline: `deadlines[path]` seconds, else `default`"""
+
+    def __init__(self, app, deadlines: dict, default: float = DEFAULT_DEADLINE):
+        self.app = app
+        self.deadlines = deadlines
+        self.default = default
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+        token = CURRENT_DEADLINE.set(Deadline(self.deadlines.get(scope["path"], self.default)))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            CURRENT_DEADLINE.reset(token)
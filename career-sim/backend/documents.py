@@ -0,0 +1,93 @@
+import io
+import os
+import time
+import asyncio
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pdfplumber
+from response_cache import make_cache, CACHE_BACKEND
+from metrics import PDF_EXTRACTION_LATENCY
+from tracing import span
+
+# --- PDF Extraction Pool ---
+# pdfplumber is pure-Python and CPU-bound; running it inside an async handler
+# stalls every other request on the worker, so pages are parsed in a process pool.
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Extractions allowed to queue for the pool at once (running + waiting)
+PDF_MAX_PENDING = int(os.getenv("PDF_MAX_PENDING", str(PDF_WORKERS * 4)))
+
+_pool = None
+_pending = asyncio.Semaphore(PDF_MAX_PENDING)
+
+def get_pdf_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: workers import only this module instead of forking the whole app
+        _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def shutdown_pdf_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def extract_pdf_text_sync(source, max_chars: int = None) -> str:
+    # source: a file path (preferred: nothing to pickle across processes) or raw bytes
+    """
+    Page-by-page text extraction (runs in a pool worker).
+    Stops once max_chars of text are collected: the agents truncate there anyway,
+    so later pages would be parsed only to be thrown away.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    parts = []
+    total = 0
+    with pdfplumber.open(source) as pdf:
+        for page in pdf.pages:
+            text = page.extract_text()
+            page.close()  # drop the page's cached layout objects
+            if not text:
+                continue
+            parts.append(text)
+            total += len(text) + 1
+            if max_chars and total >= max_chars:
+                break
+    return "\n".join(parts)
+
+async def extract_pdf_text(source, max_chars: int = None) -> str:
+    async with _pending:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_pdf_pool(), extract_pdf_text_sync, source, max_chars)
+
+# --- Document Caches ---
+# Users re-upload the same resume while iterating in the UI; identical bytes
+# should cost neither a pdfplumber pass nor a fresh analysis call.
+DOC_CACHE_BACKEND = os.getenv("DOC_CACHE_BACKEND", CACHE_BACKEND)
+DOC_CACHE_MAX_ENTRIES = int(os.getenv("DOC_CACHE_MAX_ENTRIES", "256"))
+DOC_CACHE_TTL = float(os.getenv("DOC_CACHE_TTL", str(24 * 3600)))
+
+# sha256(file bytes):max_chars -> extracted text
+TEXT_CACHE = make_cache("doc_text", DOC_CACHE_MAX_ENTRIES, DOC_CACHE_TTL, backend=DOC_CACHE_BACKEND)
+# sha256(resume text):career_goal -> analyze_resume_text result
+ANALYSIS_CACHE = make_cache("resume_analysis", DOC_CACHE_MAX_ENTRIES, DOC_CACHE_TTL, backend=DOC_CACHE_BACKEND)
+
+def content_hash(data) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+async def extract_pdf_text_cached(source, max_chars: int = None, digest: str = None) -> str:
+    """source: PDF bytes, or a file path together with its precomputed sha256 digest"""
+    key = f"{digest or content_hash(source)}:{max_chars}"
+    with span("pdf.extract") as s:
+        text = await TEXT_CACHE.get(key)
+        s.set_attribute("cache_hit", text is not None)
+        if text is None:
+            start = time.perf_counter()
+            text = await extract_pdf_text(source, max_chars)
+            PDF_EXTRACTION_LATENCY.observe(time.perf_counter() - start)
+            await TEXT_CACHE.set(key, text)
+        s.set_attribute("chars", len(text))
+    return text
@@ -0,0 +1,137 @@
+import os
+import time
+import uuid
+import asyncio
+import weakref
+from response_cache import TTLCache, SQLiteCache, CACHE_BACKEND, CACHE_PATH
+from deadlines import spawn_background
+
+# --- Interview Sessions ---
+# The server keeps each interview's transcript, so the client only posts its
+# newest answer. Older turns are folded into a rolling summary, which keeps
+# prompts the same size however long the interview runs.
+# INTERVIEW_SESSION_BACKEND=sqlite keeps sessions across restarts and workers:
+# every read goes to SQLite, with no in-process copy in front of it. The
+# per-session lock is per process, though, so two answers to one session landing
+# on different workers at the same moment are not serialized (the frontend
+# sends one answer at a time).
+SESSION_BACKEND = os.getenv("INTERVIEW_SESSION_BACKEND", CACHE_BACKEND)
+SESSION_MAX_ENTRIES = int(os.getenv("INTERVIEW_SESSION_MAX_ENTRIES", "1024"))
+SESSION_TTL = float(os.getenv("INTERVIEW_SESSION_TTL", str(2 * 3600)))
+# Latest turns sent to the model verbatim; anything older reaches it only through the summary
+RECENT_TURNS = int(os.getenv("INTERVIEW_RECENT_TURNS", "4"))
+# Extra unsummarized turns tolerated before a fold is scheduled (one summary call per batch)
+SUMMARY_BATCH_TURNS = int(os.getenv("INTERVIEW_SUMMARY_BATCH_TURNS", "2"))
+
+class InterviewSessionStore:
+    """
+    Session dicts keyed by session_id:
+    {role, focus, persona, last_question, turns: [{question, answer}], summary, summarized_turns}
+    turns[:summarized_turns] are already covered by summary.
+    """
+
+    def __init__(self, store=None):
+        # Sessions are state, not cached answers: a single tier, and no cache hit/miss metrics
+        if store is None:
+            if SESSION_BACKEND == "sqlite":
+                store = SQLiteCache(CACHE_PATH, namespace="interview_sessions", max_entries=SESSION_MAX_ENTRIES, ttl=SESSION_TTL)
+            else:
+                store = TTLCache(SESSION_MAX_ENTRIES, SESSION_TTL)
+        self._store = store
+        self._locks = weakref.WeakValueDictionary()  # session_id -> asyncio.Lock while in use
+        self._folding = {}  # session_id -> background summary task
+
+    async def create(self, role: str, focus: str, persona: str, first_question: str) -> str:
+        session_id = uuid.uuid4().hex
+        await self.save(session_id, {
+            "role": role,
+            "focus": focus,
+            "persona": persona,
+            "created_at": time.time(),
+            "last_question": first_question,
+            "turns": [],
+            "summary": "",
+            "summarized_turns": 0,
+        })
+        return session_id
+
+    async def _call(self, fn, *args):
+        # SQLite blocks, so it runs in a worker thread; the in-process store is called directly
+        if isinstance(self._store, SQLiteCache):
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    async def get(self, session_id: str):
+        return await self._call(self._store.get, session_id)
+
+    async def save(self, session_id: str, session: dict):
+        # Every save restarts the TTL: sessions expire after inactivity, not after creation
+        await self._call(self._store.set, session_id, session)
+
+    async def delete(self, session_id: str):
+        await self._call(self._store.delete, session_id)
+        task = self._folding.pop(session_id, None)
+        if task is not None:
+            task.cancel()
+
+    def lock(self, session_id: str) -> asyncio.Lock:
+        """Serializes read-modify-write of one session (double-submits, background folds)"""
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[session_id] = lock
+        return lock
+
+    async def schedule_summary(self, session_id: str, summarize):
+        """
+        Fold turns older than RECENT_TURNS into the summary in the background.
+        summarize(role, summary, turns) -> new summary text, or None to retry later.
+        """
+        session = await self.get(session_id)
+        if session is None or session_id in self._folding:
+            return
+        if len(session["turns"]) - session["summarized_turns"] < RECENT_TURNS + SUMMARY_BATCH_TURNS:
+            return
+        task = spawn_background(self._fold(session_id, summarize))
+        self._folding[session_id] = task
+        task.add_done_callback(lambda _: self._folding.pop(session_id, None))
+
+    async def _fold(self, session_id: str, summarize):
+        session = await self.get(session_id)
+        if session is None:
+            return
+        start = session["summarized_turns"]
+        upto = len(session["turns"]) - RECENT_TURNS
+        if upto <= start:
+            return
+        try:
+            summary = await summarize(session["role"], session["summary"], session["turns"][start:upto])
+        except Exception as e:
+            print(f"Interview summary failed for {session_id}: {e}")
+            return
+        if not summary:
+            return
+
+        async with self.lock(session_id):
+            # Reload: turns may have been appended while the summary was generated
+            session = await self.get(session_id)
+            if session is None or session["summarized_turns"] != start:
+                return
+            session["summary"] = summary
+            session["summarized_turns"] = upto
+            await self.save(session_id, session)
+
+    async def wait_for_summary(self, session_id: str):
+        task = self._folding.get(session_id)
+        if task is not None:
+            await asyncio.shield(task)
+
+def record_turn(session: dict, answer: str, next_question: str):
+    session["turns"].append({"question": session["last_question"], "answer": answer})
+    session["last_question"] = next_question
+
+def session_context(session: dict):
+    """(summary, unsummarized turns): what the model sees of the interview so far"""
+    return session["summary"], session["turns"][session["summarized_turns"]:]
+
+INTERVIEW_SESSIONS = InterviewSessionStore()
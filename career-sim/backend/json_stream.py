@@ -0,0 +1,95 @@
+import json
+
+class JSONArrayItemStream:
+    """
+    Incremental scanner for model JSON output. Feed it text deltas as they
+    arrive; it returns each element of the top-level array `field`
+    (e.g. "options" or "questions") as soon as that element's closing
+    brace/bracket is seen, without waiting for the rest of the document.
+
+    Anything before the first '{' (such as a ```json fence) is ignored.
+    Only object/array elements are emitted, which is all our schemas use.
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+        self._stack = []           # open containers: '{' or '['
+        self._in_string = False
+        self._escape = False
+        self._string_parts = None  # collects depth-1 strings (candidate keys)
+        self._last_key = None
+        self._target_depth = None  # stack depth of the watched array once open
+        self._item_parts = None    # raw text of the element being captured
+        self._parts = []           # full document, joined once at the end
+        self.emitted = 0
+
+    def feed(self, text: str) -> list:
+        self._parts.append(text)
+        items = []
+        item_start = 0 if self._item_parts is not None else None
+        key_start = 0 if self._string_parts is not None else None
+
+        for i, ch in enumerate(text):
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._string_parts is not None:
+                        self._string_parts.append(text[key_start:i + 1])
+                        try:
+                            self._last_key = json.loads("".join(self._string_parts))
+                        except ValueError:
+                            self._last_key = None
+                        self._string_parts = None
+                        key_start = None
+                continue
+
+            if ch == '"':
+                if not self._stack:
+                    continue
+                self._in_string = True
+                if len(self._stack) == 1:
+                    self._string_parts = []
+                    key_start = i
+            elif ch in "{[":
+                if not self._stack and ch == "[":
+                    continue  # only documents that start with an object are tracked
+                self._stack.append(ch)
+                depth = len(self._stack)
+                if depth == 2 and ch == "[" and self._last_key == self.field:
+                    self._target_depth = depth
+                elif self._target_depth is not None and depth == self._target_depth + 1:
+                    self._item_parts = []
+                    item_start = i
+            elif ch in "}]":
+                if not self._stack:
+                    continue
+                depth = len(self._stack)
+                self._stack.pop()
+                if self._target_depth is not None and depth == self._target_depth + 1 and self._item_parts is not None:
+                    self._item_parts.append(text[item_start:i + 1])
+                    raw = "".join(self._item_parts)
+                    self._item_parts = None
+                    item_start = None
+                    try:
+                        items.append(json.loads(raw))
+                        self.emitted += 1
+                    except ValueError:
+                        pass  # malformed element; the final parse will report it
+                elif self._target_depth is not None and depth == self._target_depth:
+                    self._target_depth = None
+            elif ch == "," and len(self._stack) == 1:
+                self._last_key = None
+
+        # Carry partially received element/key text over to the next delta
+        if self._item_parts is not None and item_start is not None:
+            self._item_parts.append(text[item_start:])
+        if self._string_parts is not None and key_start is not None:
+            self._string_parts.append(text[key_start:])
+        return items
+
+    def text(self) -> str:
+        return "".join(self._parts)
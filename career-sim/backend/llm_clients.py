@@ -0,0 +1,69 @@
+import os
+import asyncio
+import weakref
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+# --- Connection Pool Config ---
+# One pool is shared by all requests that go out with the same API key.
+POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "100"))
+POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "20"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY", "30"))
+# The router already fails over across keys/models, so SDK-level retries only
+# hide 429s from it and stretch the tail.
+CLIENT_MAX_RETRIES = int(os.getenv("LLM_CLIENT_MAX_RETRIES", "0"))
+
+def pool_limits():
+    return httpx.Limits(
+        max_connections=POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=POOL_MAX_KEEPALIVE,
+        keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+    )
+
+class ClientRegistry:
+    """Long-lived AsyncOpenAI clients, one per API key, each with its own keep-alive pool"""
+
+    def __init__(self, base_url: str, api_keys: list, http_options: dict = None):
+        self.base_url = base_url
+        self.api_keys = list(api_keys)
+        self.http_options = http_options or {}
+        self._clients = {}
+
+    def build_all(self):
+        for key in self.api_keys:
+            self.get(key)
+        return self
+
+    def get(self, api_key: str) -> AsyncOpenAI:
+        client = self._clients.get(api_key)
+        if client is None:
+            client = AsyncOpenAI(
+                base_url=self.base_url,
+                api_key=api_key,
+                max_retries=CLIENT_MAX_RETRIES,
+                http_client=DefaultAsyncHttpxClient(limits=pool_limits(), **self.http_options),
+            )
+            self._clients[api_key] = client
+        return client
+
+    async def aclose(self):
+        clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            await client.close()
+
+# httpx connections belong to the event loop that opened them, so the app loop
+# and the sync-shim loop each get their own registry.
+_registries = weakref.WeakKeyDictionary()
+
+def registry_for_loop(base_url: str, api_keys: list) -> ClientRegistry:
+    loop = asyncio.get_running_loop()
+    registry = _registries.get(loop)
+    if registry is None:
+        registry = ClientRegistry(base_url, api_keys)
+        _registries[loop] = registry
+    return registry
+
+async def close_loop_registry():
+    registry = _registries.pop(asyncio.get_running_loop(), None)
+    if registry is not None:
+        await registry.aclose()
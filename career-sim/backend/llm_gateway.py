@@ -0,0 +1,542 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from dotenv import load_dotenv
+from llm_clients import registry_for_loop, close_loop_registry
+from llm_router import ModelRouter
+from response_cache import make_cache, prompt_cache_key
+from singleflight import SingleFlight
+from json_stream import JSONArrayItemStream
+from prompt_cache import system_message, PROMPT_USAGE, CURRENT_AGENT
+from metrics import UPSTREAM_LATENCY, FALLBACK_DEPTH, JSON_PARSE_FAILURES
+from tracing import span
+from deadlines import DeadlineExceeded, current_deadline, within
+from admission import UPSTREAM_LIMITER
+from prompt_budget import prompt_tokens, model_fits, chat_history_ceiling, trim_messages, message_tokens
+
+load_dotenv()
+
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+
+# Parse API Keys (comma-separated support)
+api_keys_raw = os.getenv("OPENROUTER_API_KEY", "")
+API_KEYS = [k.strip() for k in api_keys_raw.split(",") if k.strip()]
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+
+if not API_KEYS:
+    print("Warning: OPENROUTER_API_KEY not found in environment variables.")
+
+# Priority list of models to try
+MODEL_CANDIDATES = [
+    "mistralai/mistral-7b-instruct:free",
+    "google/gemini-pro-1.5",
+    "openai/gpt-3.5-turbo",
+]
+
+# Per-(key, model) health tracking shared by every request in the process
+ROUTER = ModelRouter(API_KEYS, MODEL_CANDIDATES)
+
+# Parsed results of deterministic agent prompts (opt-in per call via cache_ttl)
+RESPONSE_CACHE = make_cache("llm")
+
+# Identical JSON prompts that are already in flight share one upstream call
+INFLIGHT = SingleFlight()
+
+# --- Client Registry ---
+
+def get_client(api_key: str):
+    """Pooled client for this key, reused across requests on the current event loop"""
+    return registry_for_loop(OPENROUTER_BASE_URL, API_KEYS).get(api_key)
+
+async def init_clients():
+    """Build one pooled client per configured key (call on app startup)"""
+    registry_for_loop(OPENROUTER_BASE_URL, API_KEYS).build_all()
+
+async def close_clients():
+    await close_loop_registry()
+
+class LLMUnavailableError(Exception):
+    """Every (key, model) pair failed before producing a usable answer"""
+
+# --- Hedging ---
+
+class HedgePolicy:
+    """
+    Opt-in hedging for latency-critical endpoints: if the current attempt has not
+    answered after `delay` seconds, fire the same prompt at the next healthiest
+    (key, model) pair. `max_extra` caps how many extra upstream calls (and tokens)
+    one request may spend on hedges; 0 disables hedging.
+    """
+
+    def __init__(self, delay: float, max_extra: int = 1):
+        self.delay = delay
+        self.max_extra = max_extra
+
+    @classmethod
+    def from_env(cls, name: str, delay: float, max_extra: int = 1):
+        # e.g. LLM_HEDGE_CHAT_DELAY=2.5, LLM_HEDGE_CHAT_MAX_EXTRA=0
+        return cls(
+            delay=float(os.getenv(f"LLM_HEDGE_{name}_DELAY", str(delay))),
+            max_extra=int(os.getenv(f"LLM_HEDGE_{name}_MAX_EXTRA", str(max_extra))),
+        )
+
+# --- Async Gateway ---
+# Every agent goes through these coroutines so a slow upstream model only
+# suspends the request that is waiting on it, not the whole event loop.
+
+def parse_json_content(content: str):
+    # Clean Markdown if present
+    if "```" in content:
+        content = content.replace("```json", "").replace("```", "").strip()
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        JSON_PARSE_FAILURES.inc(agent=CURRENT_AGENT.get())
+        raise
+
+def _record_attempt(key_idx: int, model: str, latency: float, error: Exception = None):
+    """Router health and upstream latency metrics for one finished attempt"""
+    if error is None:
+        ROUTER.record_success(key_idx, model, latency)
+    else:
+        ROUTER.record_failure(key_idx, model, error)
+    UPSTREAM_LATENCY.observe(latency, key=f"key_{key_idx + 1}", model=model, outcome="ok" if error is None else "error")
+
+def _timeout_kwargs(deadline):
+    # The HTTP client gives up with the request's remaining budget, not its own default
+    return {"timeout": deadline.remaining()} if deadline is not None else {}
+
+async def _attempt_json(key_idx: int, api_key: str, model: str, system_prompt: str, user_prompt: str, deadline=None):
+    """One upstream JSON call; raises on any failure so the caller can fail over"""
+    client = get_client(api_key)
+    start = time.perf_counter()
+    try:
+        # print(f"Trying Key #{key_idx+1} | Model: {model}...")
+        with span("llm.attempt", key=f"key_{key_idx + 1}", model=model):
+            completion = await client.chat.completions.create(
+                model=model,
+                **_timeout_kwargs(deadline),
+                # Static system prompt first, so the provider can reuse the cached prefix
+                messages=[
+                    system_message(system_prompt, model),
+                    {"role": "user", "content": user_prompt},
+                ],
+                response_format={"type": "json_object"},
+            )
+            with span("llm.parse"):
+                result = parse_json_content(completion.choices[0].message.content)
+    except Exception as e:
+        _record_attempt(key_idx, model, time.perf_counter() - start, e)
+        print(f"Failed (Key #{key_idx+1} | {model}): {e}")
+        raise
+    latency = time.perf_counter() - start
+    _record_attempt(key_idx, model, latency)
+    PROMPT_USAGE.record(completion.usage, latency)
+    return result
+
+async def _attempt_chat(key_idx: int, api_key: str, model: str, messages: list, deadline=None):
+    client = get_client(api_key)
+    start = time.perf_counter()
+    try:
+        print(f"Trying chat model: {model} with Key #{key_idx+1}...")
+        with span("llm.attempt", key=f"key_{key_idx + 1}", model=model):
+            completion = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                **_timeout_kwargs(deadline),
+            )
+            reply = completion.choices[0].message.content
+    except Exception as e:
+        _record_attempt(key_idx, model, time.perf_counter() - start, e)
+        print(f"Chat Model {model} failed with Key #{key_idx+1}: {e}")
+        raise
+    latency = time.perf_counter() - start
+    _record_attempt(key_idx, model, latency)
+    PROMPT_USAGE.record(completion.usage, latency)
+    return reply
+
+def _candidates(needed_tokens: int = None):
+    """Router order, minus models whose context window cannot hold the prompt"""
+    pairs = ROUTER.candidates()
+    if needed_tokens:
+        fitting = [p for p in pairs if model_fits(p[2], needed_tokens)]
+        # If nothing fits, let the upstream decide rather than failing locally
+        pairs = fitting or pairs
+    return pairs
+
+async def _first_success(attempt, hedge: HedgePolicy = None, needed_tokens: int = None, deadline=None):
+    """
+    Walk the router's candidates until one attempt succeeds. With a hedge policy,
+    attempts overlap: a stalled attempt gets company after `hedge.delay`, the first
+    valid response wins and the rest are cancelled. Returns None if all fail.
+    With a deadline, attempts share what is left of it and DeadlineExceeded ends the chain.
+    """
+    started = 0
+
+    async def counted(*pair):
+        nonlocal started
+        started += 1
+        return await attempt(*pair)
+
+    outcome = "error"
+    try:
+        result = await _failover(counted, hedge, needed_tokens, deadline)
+        outcome = "ok" if result is not None else "exhausted"
+        return result
+    except DeadlineExceeded:
+        outcome = "deadline"
+        raise
+    finally:
+        FALLBACK_DEPTH.observe(started, outcome=outcome)
+
+async def _failover(attempt, hedge: HedgePolicy, needed_tokens: int, deadline):
+    remaining = _candidates(needed_tokens)
+
+    if hedge is None or hedge.max_extra <= 0:
+        # Healthiest (key, model) pairs first; rate-limited or broken ones sit out their cooldown
+        while remaining:
+            # Skips pairs whose key/model is at capacity; waits only if all of them are
+            pair, permit = await UPSTREAM_LIMITER.acquire_any(remaining, deadline)
+            remaining.remove(pair)
+            try:
+                return await within(deadline, attempt(*pair))
+            except DeadlineExceeded:
+                raise
+            except Exception:
+                continue # Try the next healthiest pair
+            finally:
+                permit.release()
+        return None
+
+    running = set()
+    hedges_left = hedge.max_extra
+
+    async def launch(wait: bool):
+        if wait:
+            pair, permit = await UPSTREAM_LIMITER.acquire_any(remaining, deadline)
+        else:
+            # Hedges are optional: only spend capacity that is free right now
+            pair, permit = next(
+                ((p, permit) for p in remaining if (permit := UPSTREAM_LIMITER.try_acquire(p[0], p[2])) is not None),
+                (None, None),
+            )
+            if pair is None:
+                return False
+        remaining.remove(pair)
+        task = asyncio.create_task(attempt(*pair))
+        task.add_done_callback(lambda _: permit.release())
+        running.add(task)
+        return True
+
+    if remaining:
+        await launch(wait=True)
+    try:
+        while running:
+            timeout = hedge.delay if hedges_left > 0 else None
+            if deadline is not None:
+                deadline.check()
+                timeout = min(timeout, deadline.remaining()) if timeout is not None else deadline.remaining()
+            done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done and deadline is not None and deadline.expired:
+                raise DeadlineExceeded(deadline.budget)
+            if not done:
+                # Nothing back within the hedge delay: race the next pair
+                hedges_left -= 1
+                if remaining and await launch(wait=False):
+                    print(f"Hedging: {len(running)} attempts in flight")
+                elif not remaining:
+                    hedges_left = 0
+                continue
+            for task in done:
+                running.discard(task)
+                if task.exception() is None:
+                    return task.result()
+                # Plain failover does not count against the hedge budget
+                if remaining:
+                    await launch(wait=False)
+            if not running and remaining:
+                # Everything in flight failed and no pair had spare capacity: wait for one
+                await launch(wait=True)
+    finally:
+        for task in running:
+            task.cancel()
+    return None
+
+async def call_ai_json(system_prompt: str, user_prompt: str, hedge: HedgePolicy = None, cache_ttl: float = None, cache_key: str = None, cache=None, deadline=None):
+    """
+    Call OpenRouter with JSON enforcement and Key Rotation.
+    cache_ttl: opt-in for agents whose output is a pure function of the prompt;
+    identical (normalized) prompts within the TTL are served from RESPONSE_CACHE.
+    cache_key/cache: let an agent supply its own key and cache (e.g. content hashes).
+    Concurrent callers with the same prompt are coalesced into one upstream call.
+    deadline: defaults to the current request's (see deadlines.DeadlineMiddleware);
+    raises DeadlineExceeded once it has passed.
+    """
+    deadline = deadline or current_deadline()
+    cache = cache if cache is not None else RESPONSE_CACHE
+    prompt_key = cache_key or prompt_cache_key(system_prompt, user_prompt, MODEL_CANDIDATES)
+    if cache_ttl:
+        with span("llm.cache_lookup") as lookup:
+            cached = await cache.get(prompt_key)
+            lookup.set_attribute("hit", cached is not None)
+        if cached is not None:
+            return cached
+
+    async def attempt(key_idx, api_key, model):
+        return await _attempt_json(key_idx, api_key, model, system_prompt, user_prompt, deadline)
+
+    needed_tokens = prompt_tokens(system_prompt, user_prompt)
+
+    async def fetch():
+        result = await _first_success(attempt, hedge, needed_tokens, deadline)
+        if result is not None and cache_ttl:
+            await cache.set(prompt_key, result, ttl=cache_ttl)
+        return result
+
+    # Bounded here too: a coalesced caller may have less time left than the leader
+    with span("llm.call"):
+        result = await within(deadline, INFLIGHT.do(prompt_key, fetch, deadline))
+    if result is not None:
+        return result
+
+    # Fallback if ALL keys fail
+    print("CRITICAL: All API keys and models failed.")
+    return {
+        "message": "System currently overloaded. Please try again later.",
+        "question": "What is next?",
+        "context_id": "error_fallback",
+        "next_question": "System Unavailable",
+        "style_feedback": {
+            "clarity": "N/A",
+            "confidence": "N/A",
+            "tips": ["System Error - Offline"]
+        }
+    }
+
+def to_chat_messages(history: list):
+    """Convert frontend chat history (Gemini or OpenAI style) to OpenRouter messages"""
+    messages = []
+    # Convert incompatible history if present (simple conversion)
+    try:
+        for h in history:
+            if "role" in h and "parts" in h: # Gemini format
+                role = "assistant" if h["role"] == "model" else "user"
+                # Safe access to parts
+                parts = h["parts"]
+                content = ""
+                if isinstance(parts, list):
+                    content = parts[0] if len(parts) > 0 else ""
+                else:
+                    content = str(parts)
+
+                messages.append({"role": role, "content": content})
+            else:
+                messages.append(h)
+    except Exception as e:
+        print(f"Error processing history: {e}")
+    return messages
+
+def _chat_required_tokens(messages: list) -> int:
+    # Trimming can drop old turns but never the system messages or the new message
+    return sum(message_tokens(m) for m in messages if m.get("role") == "system") + message_tokens(messages[-1])
+
+async def call_ai_chat(history: list, message: str, hedge: HedgePolicy = None, deadline=None):
+    """Call OpenRouter for Chat (No JSON); deadline as in call_ai_json"""
+    deadline = deadline or current_deadline()
+    # OpenRouter expects {"role": "user/assistant", "content": "..."}
+    messages = to_chat_messages(history)
+    messages.append({"role": "user", "content": message})
+
+    async def attempt(key_idx, api_key, model):
+        return await _attempt_chat(key_idx, api_key, model, trim_messages(messages, chat_history_ceiling(model)), deadline)
+
+    with span("llm.call"):
+        reply = await _first_success(attempt, hedge, _chat_required_tokens(messages), deadline)
+    if reply is not None:
+        return reply
+
+    print("CRITICAL: All chat models/keys failed.")
+    return "I'm having trouble connecting to my brain right now. Please try again."
+
+# --- Streaming ---
+# Fallback across (key, model) pairs works until the first token is emitted;
+# after that the client has seen output, so a mid-stream failure is surfaced.
+
+def _delta_text(chunk):
+    if not chunk.choices:
+        return None
+    delta = chunk.choices[0].delta
+    return delta.content if delta is not None else None
+
+def _stream_messages(messages: list, model: str, json_mode: bool, trim_history: bool):
+    if trim_history:
+        return trim_messages(messages, chat_history_ceiling(model))
+    if json_mode and messages and messages[0]["role"] == "system":
+        # JSON agents lead with their static system prompt: same caching as _attempt_json
+        return [system_message(messages[0]["content"], model)] + messages[1:]
+    return messages
+
+async def stream_completion(messages: list, json_mode: bool = False, trim_history: bool = False):
+    """
+    Yield content deltas from the healthiest pair that produces a first token.
+    trim_history: chat messages are cut to each model's history ceiling (see call_ai_chat).
+    Every wait (connect, first token, each later chunk) is bounded by the request deadline.
+    """
+    extra = {"response_format": {"type": "json_object"}} if json_mode else {}
+    deadline = current_deadline()
+
+    if trim_history:
+        needed_tokens = _chat_required_tokens(messages)
+    else:
+        needed_tokens = prompt_tokens(*(str(m.get("content", "")) for m in messages))
+    remaining = _candidates(needed_tokens)
+    started = 0
+    while remaining:
+        if deadline is not None:
+            deadline.check()
+        pair, permit = await UPSTREAM_LIMITER.acquire_any(remaining, deadline)
+        remaining.remove(pair)
+        started += 1
+        key_idx, api_key, model = pair
+        client = get_client(api_key)
+        start = time.perf_counter()
+        stream = None
+        try:
+            # Up to the first token; the rest of the stream belongs to the agent's span
+            with span("llm.attempt", key=f"key_{key_idx + 1}", model=model, stream=True):
+                stream = await within(deadline, client.chat.completions.create(
+                    model=model,
+                    messages=_stream_messages(messages, model, json_mode, trim_history),
+                    stream=True,
+                    # Final chunk carries token usage (incl. cached prompt tokens)
+                    stream_options={"include_usage": True},
+                    **_timeout_kwargs(deadline),
+                    **extra,
+                ))
+                chunks = stream.__aiter__()
+                first = None
+                while not first:
+                    first = _delta_text(await within(deadline, chunks.__anext__()))
+        except DeadlineExceeded:
+            permit.release()
+            FALLBACK_DEPTH.observe(started, outcome="deadline")
+            if stream is not None:
+                await stream.close()
+            raise
+        except Exception as e:
+            # Includes StopAsyncIteration: a stream that ends without content
+            permit.release()
+            _record_attempt(key_idx, model, time.perf_counter() - start, e)
+            print(f"Stream failed before first token (Key #{key_idx+1} | {model}): {e!r}")
+            if stream is not None:
+                await stream.close()
+            continue
+        except BaseException:
+            # Cancelled (client disconnected) before the first token: free the key/model slot
+            permit.release()
+            if stream is not None:
+                await stream.close()
+            raise
+
+        # Failover ends at the first token, so this is the stream's fallback depth
+        FALLBACK_DEPTH.observe(started, outcome="ok")
+        usage = None
+        try:
+            yield first
+            while True:
+                try:
+                    chunk = await within(deadline, chunks.__anext__())
+                except StopAsyncIteration:
+                    break
+                usage = getattr(chunk, "usage", None) or usage
+                text = _delta_text(chunk)
+                if text:
+                    yield text
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            _record_attempt(key_idx, model, time.perf_counter() - start, e)
+            print(f"Stream broke mid-response (Key #{key_idx+1} | {model}): {e}")
+            raise
+        finally:
+            permit.release()
+            await stream.close()
+        latency = time.perf_counter() - start
+        _record_attempt(key_idx, model, latency)
+        PROMPT_USAGE.record(usage, latency)
+        return
+
+    FALLBACK_DEPTH.observe(started, outcome="exhausted")
+    print("CRITICAL: All API keys and models failed (stream).")
+    raise LLMUnavailableError("All AI models failed. Please try again later.")
+
+async def stream_ai_chat(history: list, message: str):
+    """Streaming variant of call_ai_chat"""
+    messages = to_chat_messages(history)
+    messages.append({"role": "user", "content": message})
+    try:
+        async for text in stream_completion(messages, trim_history=True):
+            yield text
+    except LLMUnavailableError:
+        yield "I'm having trouble connecting to my brain right now. Please try again."
+
+async def stream_ai_json_text(system_prompt: str, user_prompt: str):
+    """Raw JSON text deltas; parse the joined text with parse_json_content"""
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+    async for text in stream_completion(messages, json_mode=True):
+        yield text
+
+async def stream_ai_json(system_prompt: str, user_prompt: str, field: str, cache_ttl: float = None):
+    """
+    Streaming JSON mode: yields ("item", obj) for every element of the top-level
+    array `field` as soon as it closes, then ("done", full_result).
+    Shares RESPONSE_CACHE with call_ai_json, so cached results replay instantly.
+    """
+    prompt_key = prompt_cache_key(system_prompt, user_prompt, MODEL_CANDIDATES)
+    if cache_ttl:
+        cached = await RESPONSE_CACHE.get(prompt_key)
+        if cached is not None:
+            for item in cached.get(field) or []:
+                yield "item", item
+            yield "done", cached
+            return
+
+    parser = JSONArrayItemStream(field)
+    async for text in stream_ai_json_text(system_prompt, user_prompt):
+        for item in parser.feed(text):
+            yield "item", item
+
+    result = parse_json_content(parser.text())
+    if cache_ttl:
+        await RESPONSE_CACHE.set(prompt_key, result, ttl=cache_ttl)
+    yield "done", result
+
+# --- Sync Shims (scripts / REPL only, never call these from a route) ---
+
+_sync_loop = None
+_sync_loop_lock = threading.Lock()
+
+def _get_sync_loop():
+    # A single background loop keeps the shim's pooled clients alive between calls
+    global _sync_loop
+    with _sync_loop_lock:
+        if _sync_loop is None:
+            _sync_loop = asyncio.new_event_loop()
+            threading.Thread(target=_sync_loop.run_forever, name="llm-sync-loop", daemon=True).start()
+    return _sync_loop
+
+def run_sync(coro):
+    """Run a gateway/agent coroutine to completion from synchronous code"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_sync_loop()).result()
+
+def call_ai_json_sync(system_prompt: str, user_prompt: str):
+    return run_sync(call_ai_json(system_prompt, user_prompt))
+
+def call_ai_chat_sync(history: list, message: str):
+    return run_sync(call_ai_chat(history, message))
@@ -0,0 +1,122 @@
+import os
+import time
+
+# --- Router Config ---
+EWMA_ALPHA = float(os.getenv("LLM_ROUTER_EWMA_ALPHA", "0.3"))
+PRIOR_LATENCY = float(os.getenv("LLM_ROUTER_PRIOR_LATENCY", "5.0"))  # seconds, for pairs never tried
+BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+BREAKER_MAX_COOLDOWN = float(os.getenv("LLM_BREAKER_MAX_COOLDOWN", "300"))
+RATE_LIMIT_COOLDOWN = float(os.getenv("LLM_RATE_LIMIT_COOLDOWN", "20"))
+
+# Auth / credit errors mean the key itself is unusable, whatever the model
+KEY_LEVEL_STATUSES = {401, 402, 403}
+
+def error_status(error):
+    """HTTP status of an upstream error (None for network errors, bad JSON, ...)"""
+    return getattr(error, "status_code", None)
+
+def retry_after_seconds(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class PairHealth:
+    """Rolling health of one (key, model) pair"""
+
+    def __init__(self):
+        self.success_rate = 1.0
+        self.latency_ewma = None
+        self.consecutive_failures = 0
+        self.cooldown = BREAKER_COOLDOWN
+        self.available_at = 0.0  # monotonic; circuit is open until then
+        self.calls = 0
+
+    def is_open(self, now: float) -> bool:
+        return now < self.available_at
+
+    def score(self) -> float:
+        # Expected seconds per useful answer; lower is better
+        latency = self.latency_ewma if self.latency_ewma is not None else PRIOR_LATENCY
+        return latency / max(self.success_rate, 0.05)
+
+    def open_for(self, seconds: float, now: float):
+        self.available_at = max(self.available_at, now + seconds)
+
+class ModelRouter:
+    """
+    Orders (key, model) pairs by observed health instead of walking
+    API_KEYS x MODEL_CANDIDATES in fixed order on every request.
+    """
+
+    def __init__(self, api_keys: list, models: list):
+        self.api_keys = list(api_keys)
+        self.models = list(models)
+        self.health = {
+            (key_idx, model): PairHealth()
+            for key_idx in range(len(self.api_keys))
+            for model in self.models
+        }
+
+    def candidates(self):
+        """[(key_idx, key, model)] healthiest first; open circuits are skipped while others remain"""
+        now = time.monotonic()
+        # Configured order breaks ties, so a cold router behaves like the old nested loop
+        order = {pair: i for i, pair in enumerate(self.health)}
+        closed = [p for p, h in self.health.items() if not h.is_open(now)]
+        if closed:
+            pairs = sorted(closed, key=lambda p: (self.health[p].score(), order[p]))
+        else:
+            # Everything is cooling down: probe whichever reopens first (half-open)
+            pairs = sorted(self.health, key=lambda p: (self.health[p].available_at, order[p]))
+        return [(key_idx, self.api_keys[key_idx], model) for key_idx, model in pairs]
+
+    def record_success(self, key_idx: int, model: str, latency: float):
+        h = self.health[(key_idx, model)]
+        h.calls += 1
+        h.success_rate = (1 - EWMA_ALPHA) * h.success_rate + EWMA_ALPHA
+        h.latency_ewma = latency if h.latency_ewma is None else (1 - EWMA_ALPHA) * h.latency_ewma + EWMA_ALPHA * latency
+        h.consecutive_failures = 0
+        h.cooldown = BREAKER_COOLDOWN
+        h.available_at = 0.0
+
+    def record_failure(self, key_idx: int, model: str, error: Exception):
+        now = time.monotonic()
+        h = self.health[(key_idx, model)]
+        h.calls += 1
+        # Latency is learned from successes only: a fast 404 must not look like a fast pair
+        h.success_rate = (1 - EWMA_ALPHA) * h.success_rate
+        h.consecutive_failures += 1
+
+        status = error_status(error)
+        if status in KEY_LEVEL_STATUSES:
+            for m in self.models:
+                self.health[(key_idx, m)].open_for(BREAKER_MAX_COOLDOWN, now)
+        elif status == 429:
+            h.open_for(retry_after_seconds(error) or RATE_LIMIT_COOLDOWN, now)
+        elif status is not None and status >= 500:
+            h.open_for(retry_after_seconds(error) or BREAKER_COOLDOWN, now)
+
+        if h.consecutive_failures >= BREAKER_FAILURES:
+            # Breaker trips; back off exponentially while the pair keeps failing its probes
+            h.open_for(h.cooldown, now)
+            h.cooldown = min(h.cooldown * 2, BREAKER_MAX_COOLDOWN)
+
+    def snapshot(self):
+        now = time.monotonic()
+        return [
+            {
+                "key": f"Key #{key_idx+1}",
+                "model": model,
+                "success_rate": round(h.success_rate, 3),
+                "latency_ewma": None if h.latency_ewma is None else round(h.latency_ewma, 3),
+                "open": h.is_open(now),
+                "reopens_in": round(max(0.0, h.available_at - now), 1),
+                "calls": h.calls,
+            }
+            for (key_idx, model), h in self.health.items()
+        ]
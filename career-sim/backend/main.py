@@ -1,26 +1,108 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import uvicorn
 from fastapi import File, UploadFile, Form
-import pdfplumber
-import io
-import io
-import io
-from agents import generate_roadmap_ai, get_mentor_response, generate_job_recommendations, generate_course_recommendations, analyze_resume_text, generate_market_insights, generate_job_prep, generate_project_guide, generate_resume_content, generate_project_guide, generate_assessment_quiz, evaluate_assessment_results, generate_assessment_from_text, start_interview, next_interview_question, end_interview
-
-app = FastAPI(title="Career Path Simulator API")
+import os
+import json
+import uuid
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from documents import extract_pdf_text_cached, shutdown_pdf_pool
+from uploads import UploadLimitMiddleware, spooled_upload
+from prompt_format import prune
+from prompt_cache import PROMPT_USAGE
+from deadlines import DeadlineMiddleware, DeadlineExceeded, spawn_background, DEFAULT_DEADLINE, PRIORITY_INTERACTIVE
+from admission import AdmissionMiddleware, ADMISSION, UPSTREAM_LIMITER
+from metrics import METRICS, MetricsMiddleware, family
+from tracing import TracingMiddleware, span
+from response_cache import CACHES
+from llm_gateway import init_clients, close_clients, HedgePolicy, parse_json_content, INFLIGHT, ROUTER
+from agents import generate_roadmap_ai, get_mentor_response, generate_job_recommendations, generate_course_recommendations, analyze_resume_text, generate_market_insights, generate_job_prep, generate_project_guide, generate_resume_content, generate_assessment_quiz, generate_assessment_from_text, start_interview, next_interview_question, end_interview, run_agents_concurrently, RESUME_TEXT_LIMIT, ASSESSMENT_TEXT_LIMIT, stream_mentor_response, stream_next_interview_question, stream_roadmap_ai, stream_assessment_quiz, format_interview_context, summarize_interview_turns
+from interview_sessions import INTERVIEW_SESSIONS, record_turn, session_context
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pooled OpenRouter clients live for the whole process
+    await init_clients()
+    yield
+    await close_clients()
+    shutdown_pdf_pool()
+
+app = FastAPI(title="Career Path Simulator API", lifespan=lifespan)
+
+# Hedging budgets for interactive endpoints (see HedgePolicy); override via LLM_HEDGE_<NAME>_*
+CHAT_HEDGE = HedgePolicy.from_env("CHAT", delay=3.0, max_extra=1)
+INTERVIEW_HEDGE = HedgePolicy.from_env("INTERVIEW", delay=4.0, max_extra=1)
+
+# Oversized uploads are refused before the multipart body is buffered
+app.add_middleware(UploadLimitMiddleware, paths=["/api/analyze-resume", "/api/generate-assessment-from-file"])
+
+# Time budget (seconds) per endpoint, shared by all of its upstream attempts;
+# other paths get LLM_DEFAULT_DEADLINE. ENDPOINT_DEADLINES='{"/api/chat": 20}' overrides.
+ENDPOINT_DEADLINES = {
+    "/api/chat": 30,
+    "/api/chat/stream": 60,
+    "/api/start-interview": 25,
+    "/api/interview-interaction": 25,
+    "/api/interview-interaction/stream": 45,
+    "/api/interview-feedback": 60,
+    "/api/generate-insights": 45,
+    "/api/generate-roadmap": 60,
+    "/api/generate-roadmap/stream": 90,
+    "/api/recommendations": 45,
+    "/api/analyze-resume": 60,
+    "/api/market-insights": 45,
+    "/api/job-prep": 45,
+    "/api/project-guide": 45,
+    "/api/build-resume": 45,
+    "/api/generate-assessment": 60,
+    "/api/generate-assessment/stream": 90,
+    "/api/generate-assessment-from-file": 120,
+}
+ENDPOINT_DEADLINES.update(json.loads(os.getenv("ENDPOINT_DEADLINES", "{}")))
+
+# Conversational turns, where someone waits on every reply, get admission and
+# upstream capacity ahead of (and reserved from) the bulk generations on the
+# other LLM routes. ENDPOINT_PRIORITIES='{"/api/job-prep": "interactive"}' overrides.
+ENDPOINT_PRIORITIES = {
+    "/api/chat": PRIORITY_INTERACTIVE,
+    "/api/chat/stream": PRIORITY_INTERACTIVE,
+    "/api/start-interview": PRIORITY_INTERACTIVE,
+    "/api/interview-interaction": PRIORITY_INTERACTIVE,
+    "/api/interview-interaction/stream": PRIORITY_INTERACTIVE,
+    "/api/interview-feedback": PRIORITY_INTERACTIVE,
+}
+ENDPOINT_PRIORITIES.update(json.loads(os.getenv("ENDPOINT_PRIORITIES", "{}")))
+
+# LLM-backed routes wait in a bounded admission queue (503 + Retry-After when full).
+# Added before DeadlineMiddleware so it runs inside it: queueing time counts against the deadline.
+app.add_middleware(AdmissionMiddleware, paths=list(ENDPOINT_DEADLINES), priorities=ENDPOINT_PRIORITIES)
+app.add_middleware(DeadlineMiddleware, deadlines=ENDPOINT_DEADLINES, default=DEFAULT_DEADLINE)
+# Wraps admission and deadlines, so endpoint latency includes admission queueing and rejected requests
+app.add_middleware(MetricsMiddleware, paths=list(ENDPOINT_DEADLINES))
+# Per-request spans + Server-Timing header; a pass-through unless TRACING_EXPORTER is set
+app.add_middleware(TracingMiddleware)
 
 # Configure CORS
+# Added last so it is outermost: responses sent by the middlewares above
+# (413 uploads, 503 + Retry-After) still carry the CORS headers the browser needs.
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], # Allow all for prototype
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
 
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request, exc: DeadlineExceeded):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
 # Models
 class AcademicProfile(BaseModel):
     education_level: str
@@ -150,17 +232,58 @@ class ResumeBuildRequest(BaseModel):
 async def root():
     return {"status": "ok", "message": "Career Path Simulator Backend is running"}
 
+@app.get("/api/llm-usage")
+async def llm_usage():
+    """Per-agent prompt tokens and provider-cached prompt tokens since startup, plus current load and (key, model) health"""
+    return {
+        "agents": PROMPT_USAGE.snapshot(),
+        "admission": ADMISSION.snapshot(),
+        "upstream_limits": UPSTREAM_LIMITER.snapshot(),
+        "router": ROUTER.snapshot(),
+    }
+
+# --- Metrics ---
+# Counters that already exist elsewhere are exported as they are at scrape time
+@METRICS.collector
+def cache_metrics():
+    stats = {name: cache.stats() for name, cache in sorted(CACHES.items())}
+    inflight = INFLIGHT.stats()
+    return (
+        family("careersim_cache_hits_total", "counter", "Response/document cache hits",
+               [({"cache": name}, s["hits"]) for name, s in stats.items()])
+        + family("careersim_cache_misses_total", "counter", "Response/document cache misses",
+                 [({"cache": name}, s["misses"]) for name, s in stats.items()])
+        + family("careersim_cache_hit_ratio", "gauge", "Hits / lookups since startup",
+                 [({"cache": name}, s["hit_rate"]) for name, s in stats.items()])
+        + family("careersim_singleflight_calls_total", "counter", "JSON gateway calls: leaders went upstream, coalesced shared a leader's result",
+                 [({"role": "leader"}, inflight["upstream_calls"]), ({"role": "coalesced"}, inflight["coalesced_calls"])])
+    )
+
+@METRICS.collector
+def token_metrics():
+    agents = PROMPT_USAGE.snapshot()
+    return family("careersim_llm_tokens_total", "counter", "Tokens reported by the provider, per agent", [
+        ({"agent": name, "kind": kind}, usage[f"{kind}_tokens"])
+        for name, usage in agents.items()
+        for kind in ("prompt", "cached", "completion")
+    ])
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of latency histograms, fallback depth, cache and token counters"""
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
 @app.post("/api/generate-insights")
 async def generate_insights_endpoint(input_data: CareerInput):
     from agents import generate_profile_insights
-    insights = generate_profile_insights(input_data.dict())
+    insights = await generate_profile_insights(input_data.dict(exclude_unset=True))
     if "error" in insights:
          raise HTTPException(status_code=500, detail=insights["error"])
     return insights
 
 @app.post("/api/generate-roadmap")
 async def generate_roadmap_endpoint(input_data: CareerInput):
-    roadmap = generate_roadmap_ai(input_data.dict())
+    roadmap = await generate_roadmap_ai(input_data.dict(exclude_unset=True))
     if "error" in roadmap:
         raise HTTPException(status_code=500, detail=roadmap["error"])
     return roadmap
@@ -168,18 +291,71 @@ async def generate_roadmap_endpoint(input_data: CareerInput):
 @app.post("/api/chat")
 async def chat_endpoint(request: ChatRequest):
     # Map 'user'/'model' roles if needed, currently assuming frontend sends correct format
-    response_text = get_mentor_response(request.history, request.message)
+    response_text = await get_mentor_response(request.history, request.message, hedge=CHAT_HEDGE)
     return {"role": "model", "parts": [response_text]}
 
+# --- Streaming (SSE) ---
+
+def sse(data: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+def sse_response(events):
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def sse_json_items(stream, item_event: str):
+    """Forward ("item", obj)/("done", result) pairs from a streaming JSON agent as SSE"""
+    index = 0
+    try:
+        async for kind, payload in stream:
+            if kind == "item":
+                yield sse({"index": index, "item": payload}, event=item_event)
+                index += 1
+            else:
+                yield sse(payload, event="done")
+    except Exception as e:
+        yield sse({"error": str(e)}, event="error")
+
+@app.post("/api/generate-roadmap/stream")
+async def generate_roadmap_stream_endpoint(input_data: CareerInput):
+    """Each career option is sent as an `option` event as soon as the model closes it"""
+    return sse_response(sse_json_items(stream_roadmap_ai(input_data.dict(exclude_unset=True)), "option"))
+
+@app.post("/api/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """Same as /api/chat, but tokens are forwarded as `data: {"delta": ...}` events"""
+    async def events():
+        parts = []
+        try:
+            async for token in stream_mentor_response(request.history, request.message):
+                parts.append(token)
+                yield sse({"delta": token})
+        except Exception as e:
+            yield sse({"error": str(e)}, event="error")
+            return
+        yield sse({"role": "model", "parts": ["".join(parts)]}, event="done")
+    return sse_response(events())
+
 @app.post("/api/recommendations")
 async def get_recommendations(req: RecRequest):
-    jobs = generate_job_recommendations(req.user_data, req.career_path)
-    courses = generate_course_recommendations(req.user_data, req.career_path)
-    
-    return {
-        "jobs": jobs.get("jobs", []),
-        "courses": courses.get("courses", [])
-    }
+    # Job and course agents are independent: run them side by side
+    user_data = prune(req.user_data)
+    results, errors = await run_agents_concurrently({
+        "jobs": generate_job_recommendations(user_data, req.career_path),
+        "courses": generate_course_recommendations(user_data, req.career_path),
+    })
+
+    response = {"errors": errors}
+    for section in ("jobs", "courses"):
+        items = results.get(section, {}).get(section)
+        if items is None and section not in errors:
+            errors[section] = f"No {section} returned by the agent."
+        response[section] = items or []
+    return response
 
 @app.post("/api/analyze-resume")
 async def analyze_resume_endpoint(
@@ -190,28 +366,29 @@ async def analyze_resume_endpoint(
         raise HTTPException(status_code=400, detail="Only PDF files are allowed.")
     
     try:
-        # Extract text using pdfplumber
-        content = await file.read()
-        text = ""
-        with pdfplumber.open(io.BytesIO(content)) as pdf:
-            for page in pdf.pages:
-                text += page.extract_text() + "\n"
+        # Spool to disk in chunks, then extract using pdfplumber (process pool, stops at the agent's limit)
+        async with spooled_upload(file) as upload:
+            text = await extract_pdf_text_cached(upload.path, max_chars=RESUME_TEXT_LIMIT, digest=upload.sha256)
         
         if not text.strip():
              raise HTTPException(status_code=400, detail="Could not extract text from PDF.")
              
-        analysis = analyze_resume_text(text, career_goal)
+        analysis = await analyze_resume_text(text, career_goal)
         if "error" in analysis:
              raise HTTPException(status_code=500, detail=analysis["error"])
         return analysis
         
+    except HTTPException:
+        raise
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/market-insights")
 async def market_insights_endpoint(input_data: MarketInput):
     try:
-        insights = generate_market_insights(
+        insights = await generate_market_insights(
             input_data.target_role, 
             input_data.skills, 
             input_data.location
@@ -219,13 +396,15 @@ async def market_insights_endpoint(input_data: MarketInput):
         if "error" in insights:
              raise HTTPException(status_code=500, detail=insights["error"])
         return insights
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/job-prep")
 async def job_prep_endpoint(input_data: JobPrepRequest):
     try:
-        prep = generate_job_prep(
+        prep = await generate_job_prep(
             input_data.job_title,
             input_data.company,
             input_data.skills
@@ -233,29 +412,35 @@ async def job_prep_endpoint(input_data: JobPrepRequest):
         if "error" in prep:
              raise HTTPException(status_code=500, detail=prep["error"])
         return prep
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/project-guide")
 async def project_guide_endpoint(input_data: ProjectGuideRequest):
     try:
-        guide = generate_project_guide(
+        guide = await generate_project_guide(
             input_data.title,
             input_data.description
         )
         if "error" in guide:
              raise HTTPException(status_code=500, detail=guide["error"])
         return guide
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/build-resume")
 async def build_resume_endpoint(input_data: ResumeBuildRequest):
     try:
-        resume = generate_resume_content(input_data.dict())
+        resume = await generate_resume_content(input_data.dict())
         if "error" in resume:
              raise HTTPException(status_code=500, detail=resume["error"])
         return resume
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -270,39 +455,78 @@ class AssessmentEvalRequest(BaseModel):
     topic: str
     user_answers: List[Dict[str, Any]] # e.g. [{"question_id": 1, "selected_index": 2}]
     quiz_context: List[Dict[str, Any]] # Full quiz data to avoid statefulness in backend
+    narrative: bool = True # Also generate the LLM summary/recommendations (fetched via narrative_id)
+
+# LLM narratives for graded quizzes, generated after the score has been returned
+NARRATIVE_TASKS = OrderedDict()
+MAX_NARRATIVE_TASKS = 512
+NARRATIVE_WAIT_SECONDS = 60
 
 @app.post("/api/generate-assessment")
 async def generate_assessment_endpoint(req: AssessmentGenRequest):
     from agents import generate_assessment_quiz
-    quiz = generate_assessment_quiz(req.topic, req.difficulty, req.count)
+    quiz = await generate_assessment_quiz(req.topic, req.difficulty, req.count)
     if "error" in quiz:
         raise HTTPException(status_code=500, detail=quiz["error"])
     return quiz
 
+@app.post("/api/generate-assessment/stream")
+async def generate_assessment_stream_endpoint(req: AssessmentGenRequest):
+    """Each quiz question is sent as a `question` event as soon as the model closes it"""
+    return sse_response(sse_json_items(stream_assessment_quiz(req.topic, req.difficulty, req.count), "question"))
+
 @app.post("/api/evaluate-assessment")
 async def evaluate_assessment_endpoint(req: AssessmentEvalRequest):
-    from agents import evaluate_assessment_results
-    eval_result = evaluate_assessment_results(req.topic, req.user_answers, req.quiz_context)
-    if "error" in eval_result:
-        raise HTTPException(status_code=500, detail=eval_result["error"])
+    """Score is computed locally and returned at once; the prose follows via narrative_id"""
+    from agents import score_assessment, generate_assessment_narrative
+    eval_result = score_assessment(req.topic, req.user_answers, req.quiz_context)
+    eval_result.update({"summary": None, "recommendations": [], "narrative_id": None})
+
+    if req.narrative:
+        narrative_id = uuid.uuid4().hex
+        NARRATIVE_TASKS[narrative_id] = spawn_background(
+            generate_assessment_narrative(req.topic, eval_result, req.quiz_context)
+        )
+        while len(NARRATIVE_TASKS) > MAX_NARRATIVE_TASKS:
+            _, stale = NARRATIVE_TASKS.popitem(last=False)
+            stale.cancel()
+        eval_result["narrative_id"] = narrative_id
     return eval_result
 
+@app.get("/api/evaluate-assessment/{narrative_id}/narrative")
+async def assessment_narrative_endpoint(narrative_id: str):
+    task = NARRATIVE_TASKS.get(narrative_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired narrative_id.")
+    try:
+        narrative = await asyncio.wait_for(asyncio.shield(task), timeout=NARRATIVE_WAIT_SECONDS)
+    except Exception as e:
+        if not task.done():
+            raise HTTPException(status_code=504, detail="Narrative is still being generated.")
+        # The generation itself failed (including its own background deadline): final, not "retry later"
+        raise HTTPException(status_code=502, detail=f"Mentor feedback is unavailable: {e}")
+    if "error" in narrative:
+        raise HTTPException(status_code=500, detail=narrative["error"])
+    # All keys/models down: call_ai_json's overload fallback carries no summary
+    if narrative.get("context_id") == "error_fallback" or not narrative.get("summary"):
+        raise HTTPException(status_code=503, detail="Mentor feedback is unavailable right now.")
+    return {
+        "summary": narrative.get("summary"),
+        "recommendations": narrative.get("recommendations", []),
+    }
+
 @app.post("/api/generate-assessment-from-file")
-async def generate_assessment_from_file(file: UploadFile = File(...), count: int = Form(10)):
+async def generate_assessment_from_file(file: UploadFile = File(...), count: int = Form(10), mode: str = Form("auto")):
     try:
         content = ""
-        if file.filename.endswith(".pdf"):
-            # Process PDF
-            pdf_bytes = await file.read()
-            with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-                for page in pdf.pages:
-                    text = page.extract_text()
-                    if text:
-                        content += text + "\n"
-        else:
-             # Process Text/Markdown
-            content_bytes = await file.read()
-            content = content_bytes.decode("utf-8")
+        async with spooled_upload(file) as upload:
+            if file.filename.endswith(".pdf"):
+                # Process PDF
+                content = await extract_pdf_text_cached(upload.path, max_chars=ASSESSMENT_TEXT_LIMIT, digest=upload.sha256)
+            else:
+                # Process Text/Markdown
+                with span("text.read"), open(upload.path, encoding="utf-8") as f:
+                    content = f.read()
         
         if not content.strip():
              # Fallback if empty or failed extract
@@ -313,11 +537,15 @@ async def generate_assessment_from_file(file: UploadFile = File(...), count: int
 
         # Assuming generate_assessment_from_text is defined elsewhere, e.g., in agents.py
         from agents import generate_assessment_from_text 
-        quiz = generate_assessment_from_text(content, count)
+        quiz = await generate_assessment_from_text(content, count, mode)
         if "error" in quiz:
             raise HTTPException(status_code=500, detail=quiz["error"])
         return quiz
 
+    except HTTPException:
+        raise
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         print(f"Error processing file: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -330,28 +558,116 @@ class InterviewStartRequest(BaseModel):
     persona: str = "Friendly"
 
 class InterviewInteractionRequest(BaseModel):
-    role: str
-    history: List[dict]
-    last_question: str
+    # With a session_id (from /api/start-interview) only user_answer is needed;
+    # role/history/last_question/persona remain for stateless clients.
+    session_id: Optional[str] = None
+    role: Optional[str] = None
+    history: List[dict] = []
+    last_question: Optional[str] = None
     user_answer: str
     persona: str = "Friendly"
 
 class InterviewFeedbackRequest(BaseModel):
-    role: str
-    history: list # Full conversation history
+    session_id: Optional[str] = None
+    role: Optional[str] = None
+    history: list = [] # Full conversation history (stateless clients only)
+
+# How long feedback waits for an in-flight summary fold
+SUMMARY_WAIT_SECONDS = 10
+
+async def _interview_session(session_id: str):
+    session = await INTERVIEW_SESSIONS.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Interview session not found or expired. Please start a new interview.")
+    return session
+
+def _stateless_interview(request: InterviewInteractionRequest):
+    if not request.role or request.last_question is None:
+        raise HTTPException(status_code=422, detail="role and last_question are required without a session_id.")
+
+def _next_question_args(session: dict):
+    summary, recent = session_context(session)
+    return dict(role=session["role"], history=recent, last_question=session["last_question"], persona=session["persona"], context=format_interview_context(summary, recent))
+
+async def _advance_session(session_id: str, session: dict, user_answer: str, result: dict):
+    # Overload fallbacks are not real questions: leave the session where it was so the answer can be resent
+    if result.get("context_id") == "error_fallback" or not result.get("next_question"):
+        return
+    record_turn(session, user_answer, result["next_question"])
+    await INTERVIEW_SESSIONS.save(session_id, session)
 
 @app.post("/api/start-interview")
 async def api_start_interview(request: InterviewStartRequest):
-    return start_interview(request.role, request.focus, request.persona)
+    result = await start_interview(request.role, request.focus, request.persona, hedge=INTERVIEW_HEDGE)
+    if result.get("context_id") != "error_fallback":
+        result["session_id"] = await INTERVIEW_SESSIONS.create(request.role, request.focus, request.persona, result.get("question", ""))
+    return result
 
 @app.post("/api/interview-interaction")
 async def api_interview_interaction(request: InterviewInteractionRequest):
-    return next_interview_question(request.role, request.history, request.last_question, request.user_answer, request.persona)
+    if request.session_id is None:
+        _stateless_interview(request)
+        return await next_interview_question(request.role, request.history, request.last_question, request.user_answer, request.persona, hedge=INTERVIEW_HEDGE)
+
+    async with INTERVIEW_SESSIONS.lock(request.session_id):
+        session = await _interview_session(request.session_id)
+        result = await next_interview_question(user_answer=request.user_answer, hedge=INTERVIEW_HEDGE, **_next_question_args(session))
+        await _advance_session(request.session_id, session, request.user_answer, result)
+    await INTERVIEW_SESSIONS.schedule_summary(request.session_id, summarize_interview_turns)
+    return result
+
+@app.post("/api/interview-interaction/stream")
+async def api_interview_interaction_stream(request: InterviewInteractionRequest):
+    """Raw JSON deltas as they arrive, then a `done` event carrying the parsed response"""
+    if request.session_id is None:
+        _stateless_interview(request)
+    else:
+        await _interview_session(request.session_id)  # 404 before the stream starts
+
+    async def events():
+        parts = []
+        session = None
+        try:
+            if request.session_id is None:
+                tokens = stream_next_interview_question(request.role, request.history, request.last_question, request.user_answer, request.persona)
+                async for token in tokens:
+                    parts.append(token)
+                    yield sse({"delta": token})
+                with span("llm.parse"):
+                    result = parse_json_content("".join(parts))
+            else:
+                async with INTERVIEW_SESSIONS.lock(request.session_id):
+                    session = await _interview_session(request.session_id)
+                    async for token in stream_next_interview_question(user_answer=request.user_answer, **_next_question_args(session)):
+                        parts.append(token)
+                        yield sse({"delta": token})
+                    with span("llm.parse"):
+                        result = parse_json_content("".join(parts))
+                    await _advance_session(request.session_id, session, request.user_answer, result)
+                await INTERVIEW_SESSIONS.schedule_summary(request.session_id, summarize_interview_turns)
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            yield sse({"error": detail}, event="error")
+            return
+        yield sse(result, event="done")
+    return sse_response(events())
 
 @app.post("/api/interview-feedback")
 async def api_interview_feedback(request: InterviewFeedbackRequest):
-    return end_interview(request.role, request.history)
+    if request.session_id is None:
+        if not request.role:
+            raise HTTPException(status_code=422, detail="role is required without a session_id.")
+        return await end_interview(request.role, request.history)
 
+    session = await _interview_session(request.session_id)
+    # A fold in flight covers turns the feedback prompt would otherwise see only partially
+    try:
+        await asyncio.wait_for(INTERVIEW_SESSIONS.wait_for_summary(request.session_id), SUMMARY_WAIT_SECONDS)
+    except asyncio.TimeoutError:
+        pass  # go with the older summary plus the unsummarized turns
+    session = await _interview_session(request.session_id)
+    summary, recent = session_context(session)
+    return await end_interview(session["role"], recent, summary)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,174 @@
+import time
+import bisect
+import threading
+
+# --- Metrics ---
+# Counters and histograms rendered in the Prometheus text format at /metrics.
+# Hand-rolled rather than pulling in prometheus_client: a few thread-safe dicts
+# are all the gateway needs. Values that already live elsewhere (cache hit
+# counts, token totals) are read at scrape time by collectors instead of being
+# counted twice.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+PDF_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DEPTH_BUCKETS = (1, 2, 3, 4, 6, 8, 12)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def family(name: str, kind: str, help_text: str, samples) -> list:
+    """Exposition lines for one metric: samples are (labels dict, value) or (suffix, labels, value)"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for sample in samples:
+        suffix, labels, value = sample if len(sample) == 3 else ("", *sample)
+        lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+    return lines
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(l, "")) for l in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            values = dict(self._values)
+        return family(self.name, "counter", self.help, [
+            (dict(zip(self.labels, key)), value) for key, value in sorted(values.items())
+        ])
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(l, "")) for l in self.labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def render(self) -> list:
+        with self._lock:
+            series = {key: list(s) for key, s in self._series.items()}
+        samples = []
+        for key, s in sorted(series.items()):
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), s[:-1]):
+                cumulative += count
+                samples.append(("_bucket", {**labels, "le": _format_value(float(bound))}, cumulative))
+            samples.append(("_sum", labels, round(s[-1], 6)))
+            samples.append(("_count", labels, cumulative))
+        return family(self.name, "histogram", self.help, samples)
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name: str, help_text: str, labels: tuple = ()) -> Counter:
+        metric = Counter(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """fn() -> exposition lines (see family), called on every scrape"""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for fn in self._collectors:
+            try:
+                lines.extend(fn())
+            except Exception as e:
+                print(f"Metrics collector {getattr(fn, '__name__', fn)} failed: {e}")
+        return "\n".join(lines) + "\n"
+
+METRICS = MetricsRegistry()
+
+HTTP_LATENCY = METRICS.histogram(
+    "careersim_http_request_duration_seconds", "Time to the end of the response body, by route template",
+    ("method", "route", "status"),
+)
+AGENT_LATENCY = METRICS.histogram(
+    "careersim_agent_duration_seconds", "Wall time of one agent function call (streams: until exhausted)",
+    ("agent", "outcome"),
+)
+UPSTREAM_LATENCY = METRICS.histogram(
+    "careersim_upstream_duration_seconds", "One upstream attempt on a (key, model) pair",
+    ("key", "model", "outcome"),
+)
+FALLBACK_DEPTH = METRICS.histogram(
+    "careersim_fallback_depth", "Upstream attempts started for one gateway call (1 = first pair answered)",
+    ("outcome",), DEPTH_BUCKETS,
+)
+JSON_PARSE_FAILURES = METRICS.counter(
+    "careersim_json_parse_failures_total", "Model responses that were not valid JSON", ("agent",),
+)
+PDF_EXTRACTION_LATENCY = METRICS.histogram(
+    "careersim_pdf_extraction_duration_seconds", "PDF text extraction incl. waiting for a pool worker (cache misses only)", (), PDF_BUCKETS,
+)
+
+class MetricsMiddleware:
+    """
+    Records HTTP_LATENCY per route template (so path parameters do not explode
+    the label set). Requests answered before routing (e.g. admission 503s) are
+    labelled with their path if it is one of `paths`.
+    """
+
+    def __init__(self, app, paths=()):
+        self.app = app
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        # CORS preflights are answered without touching an endpoint; leave them out of its latency
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", None)
+            if route is None:
+                route = scope["path"] if scope["path"] in self.paths else "unmatched"
+            HTTP_LATENCY.observe(time.perf_counter() - start, method=scope["method"], route=route, status=status["code"])
@@ -0,0 +1,203 @@
+import os
+import re
+import json
+
+# --- Tokenizer ---
+# tiktoken is optional (pip install tiktoken). Without it, token counts fall
+# back to a chars/4 estimate, which is close enough for budgeting English text.
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+CHARS_PER_TOKEN = 4
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if max_tokens <= 0:
+        return ""
+    if _ENCODING is not None:
+        tokens = _ENCODING.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else _ENCODING.decode(tokens[:max_tokens])
+    return text[:max_tokens * CHARS_PER_TOKEN]
+
+# --- Model Budgets ---
+# Context windows of MODEL_CANDIDATES (prompt + completion)
+MODEL_CONTEXT_TOKENS = {
+    "mistralai/mistral-7b-instruct:free": 32768,
+    "google/gemini-pro-1.5": 2000000,
+    "openai/gpt-3.5-turbo": 16385,
+}
+DEFAULT_CONTEXT_TOKENS = 8192
+# Room kept free for the model's answer
+OUTPUT_RESERVE_TOKENS = int(os.getenv("LLM_OUTPUT_RESERVE_TOKENS", "2048"))
+
+# How much document text each agent may spend (well below every context window: cost and latency)
+RESUME_TOKEN_BUDGET = int(os.getenv("RESUME_TOKEN_BUDGET", "3000"))
+ASSESSMENT_CHUNK_TOKENS = int(os.getenv("ASSESSMENT_CHUNK_TOKENS", "3500"))
+ASSESSMENT_MAX_CHUNKS = int(os.getenv("ASSESSMENT_MAX_CHUNKS", "12"))
+# Study material read per upload (~100 pages); map-reduce samples sections across all of it
+ASSESSMENT_MAX_TEXT_CHARS = int(os.getenv("ASSESSMENT_MAX_TEXT_CHARS", "400000"))
+# Section prompts in flight at once for one map-reduce quiz
+ASSESSMENT_MAP_CONCURRENCY = int(os.getenv("ASSESSMENT_MAP_CONCURRENCY", "4"))
+
+# Mentor chat history (running summary + verbatim turns) sent to each model;
+# CHAT_HISTORY_TOKEN_CEILINGS='{"model": tokens}' overrides per model
+CHAT_HISTORY_MAX_TOKENS = int(os.getenv("CHAT_HISTORY_MAX_TOKENS", "4000"))
+CHAT_HISTORY_TOKEN_CEILINGS = {
+    "mistralai/mistral-7b-instruct:free": 4000,
+    "google/gemini-pro-1.5": 8000,
+    "openai/gpt-3.5-turbo": 4000,
+}
+CHAT_HISTORY_TOKEN_CEILINGS.update(json.loads(os.getenv("CHAT_HISTORY_TOKEN_CEILINGS", "{}")))
+
+def context_tokens(model: str) -> int:
+    return MODEL_CONTEXT_TOKENS.get(model, DEFAULT_CONTEXT_TOKENS)
+
+def prompt_tokens(*parts: str) -> int:
+    # ~4 tokens of chat framing per message
+    return sum(count_tokens(p) + 4 for p in parts)
+
+def model_fits(model: str, needed_prompt_tokens: int) -> bool:
+    return needed_prompt_tokens + OUTPUT_RESERVE_TOKENS <= context_tokens(model)
+
+def chat_history_ceiling(model: str) -> int:
+    configured = CHAT_HISTORY_TOKEN_CEILINGS.get(model, CHAT_HISTORY_MAX_TOKENS)
+    return min(configured, context_tokens(model) - OUTPUT_RESERVE_TOKENS)
+
+def message_tokens(message: dict) -> int:
+    return prompt_tokens(str(message.get("content", "")))
+
+def trim_messages(messages: list, max_tokens: int) -> list:
+    """
+    Drop the oldest conversational messages until the list fits max_tokens.
+    System messages (instructions, running summary) and the final message are always kept.
+    """
+    if sum(message_tokens(m) for m in messages) <= max_tokens:
+        return messages
+    if not messages:
+        return messages
+    *body, last = messages
+    kept = [m for m in body if m.get("role") == "system"]
+    remaining = max_tokens - message_tokens(last) - sum(message_tokens(m) for m in kept)
+    recent = []
+    for m in reversed(body):
+        if m.get("role") == "system":
+            continue
+        cost = message_tokens(m)
+        if cost > remaining:
+            break
+        recent.append(m)
+        remaining -= cost
+    return kept + recent[::-1] + [last]
+
+# --- Sections & Chunking ---
+
+_HEADING = re.compile(
+    r"^\s*(#{1,6}\s+.+|[A-Z][A-Z &/\-]{2,40}:?|[A-Z][\w &/\-]{1,40}:)\s*$"
+)
+# Resume sections worth keeping first when we cannot send everything
+PRIORITY_HEADINGS = [
+    ("skill", 5), ("experience", 4), ("employment", 4), ("work", 4), ("project", 3),
+    ("summary", 3), ("objective", 2), ("profile", 2), ("certif", 2), ("education", 2),
+    ("achievement", 1), ("award", 1),
+]
+# Most of the budget one oversized section may take once truncated, so the rest still fit
+SECTION_MAX_SHARE = 0.4
+
+def split_sections(text: str) -> list:
+    """[(heading, body)] split on heading-looking lines; text before the first heading has heading ''"""
+    sections = []
+    heading, lines = "", []
+    for line in text.splitlines():
+        if _HEADING.match(line) and len(line.split()) <= 6:
+            if lines or heading:
+                sections.append((heading, "\n".join(lines).strip()))
+            heading, lines = line.strip(), []
+        else:
+            lines.append(line)
+    if lines or heading:
+        sections.append((heading, "\n".join(lines).strip()))
+    return sections
+
+def _section_score(heading: str, body: str, keywords: set) -> float:
+    lowered = heading.lower()
+    score = max((weight for key, weight in PRIORITY_HEADINGS if key in lowered), default=0)
+    if keywords:
+        words = set(re.findall(r"[a-z0-9+#]+", (heading + " " + body).lower()))
+        score += 2 * len(words & keywords) / len(keywords)
+    return score
+
+def select_relevant_sections(text: str, budget_tokens: int, focus: str = "") -> str:
+    """
+    Return `text` unchanged if it fits the token budget; otherwise keep the
+    name/contact block plus the most relevant sections (skills/experience
+    headings and overlap with `focus`), in document order. A section that does
+    not fit is trimmed to at most SECTION_MAX_SHARE of the budget.
+    """
+    if count_tokens(text) <= budget_tokens:
+        return text
+
+    sections = split_sections(text)
+    keywords = set(re.findall(r"[a-z0-9+#]+", focus.lower())) if focus else set()
+    ranked = sorted(
+        range(1, len(sections)),
+        key=lambda i: -_section_score(sections[i][0], sections[i][1], keywords),
+    )
+
+    max_share = max(50, int(budget_tokens * SECTION_MAX_SHARE))
+    chosen, remaining = {}, budget_tokens
+    for i in [0] + ranked:  # the name/contact block always goes in
+        heading, body = sections[i]
+        block = f"{heading}\n{body}" if heading else body
+        cost = count_tokens(block) + 1
+        if cost <= remaining:
+            chosen[i] = block
+            remaining -= cost
+        elif remaining > 50:
+            share = min(remaining, max_share)
+            chosen[i] = truncate_to_tokens(block, share - 1)
+            remaining -= share
+        if remaining <= 50:
+            break
+    return "\n".join(chosen[i] for i in sorted(chosen))
+
+def chunk_text(text: str, chunk_tokens: int, max_chunks: int = None) -> list:
+    """Split on section/paragraph boundaries into chunks of at most ~chunk_tokens"""
+    blocks = []
+    for heading, body in split_sections(text):
+        section = f"{heading}\n{body}" if heading else body
+        for para in re.split(r"\n\s*\n", section):
+            para = para.strip()
+            if not para:
+                continue
+            while count_tokens(para) > chunk_tokens:
+                head = truncate_to_tokens(para, chunk_tokens)
+                blocks.append(head)
+                para = para[len(head):].strip()
+            if para:
+                blocks.append(para)
+
+    chunks, current, used = [], [], 0
+    for block in blocks:
+        cost = count_tokens(block) + 1
+        if current and used + cost > chunk_tokens:
+            chunks.append("\n\n".join(current))
+            current, used = [], 0
+        current.append(block)
+        used += cost
+    if current:
+        chunks.append("\n\n".join(current))
+
+    if max_chunks and len(chunks) > max_chunks:
+        # Sample evenly across the document instead of dropping its tail
+        step = len(chunks) / max_chunks
+        chunks = [chunks[int(i * step)] for i in range(max_chunks)]
+    return chunks
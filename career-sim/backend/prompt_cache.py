@@ -0,0 +1,124 @@
+import os
+import time
+import inspect
+import threading
+import functools
+import contextvars
+from metrics import AGENT_LATENCY
+from tracing import span
+
+# --- Prompt Prefix Caching ---
+# Providers reuse the longest prompt prefix they have already seen. Agent system
+# prompts are static (per-request values go in the user message, see
+# prompt_format), so every call to an agent starts with the same bytes.
+# OpenAI-family models cache such prefixes automatically; Anthropic and Gemini
+# models on OpenRouter need an explicit cache_control breakpoint.
+PROMPT_CACHE_MODEL_PREFIXES = tuple(
+    p.strip() for p in os.getenv("LLM_PROMPT_CACHE_MODELS", "anthropic/,google/gemini").split(",") if p.strip()
+)
+
+def supports_cache_control(model: str) -> bool:
+    return model.startswith(PROMPT_CACHE_MODEL_PREFIXES)
+
+def system_message(content: str, model: str) -> dict:
+    """System message, marked as a cache breakpoint where the model supports it"""
+    if supports_cache_control(model):
+        return {
+            "role": "system",
+            "content": [{"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}],
+        }
+    return {"role": "system", "content": content}
+
+# --- Usage Accounting ---
+# Which agent an upstream call belongs to; set by @llm_agent and inherited by
+# tasks spawned inside the agent (hedged attempts, single-flight leaders).
+CURRENT_AGENT = contextvars.ContextVar("llm_agent", default="other")
+
+async def _labelled_stream(name: str, stream):
+    token = CURRENT_AGENT.set(name)
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        with span(f"agent.{name}"):
+            async for item in stream:
+                yield item
+        outcome = "ok"
+    finally:
+        AGENT_LATENCY.observe(time.perf_counter() - start, agent=name, outcome=outcome)
+        try:
+            CURRENT_AGENT.reset(token)
+        except ValueError:
+            pass  # generator finalized outside the task that iterated it
+
+def llm_agent(name: str):
+    """
+    Label the upstream calls made by an agent (and time/trace it): a coroutine
+    function, or a function returning an async generator (the streaming agents).
+    """
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                token = CURRENT_AGENT.set(name)
+                start = time.perf_counter()
+                outcome = "error"
+                try:
+                    with span(f"agent.{name}"):
+                        result = await fn(*args, **kwargs)
+                    outcome = "ok"
+                    return result
+                finally:
+                    AGENT_LATENCY.observe(time.perf_counter() - start, agent=name, outcome=outcome)
+                    CURRENT_AGENT.reset(token)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                return _labelled_stream(name, fn(*args, **kwargs))
+        return wrapper
+    return decorate
+
+class PromptUsage:
+    """Per-agent prompt/cached token totals and latency, split by whether the provider reported a cache hit"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._agents = {}
+
+    def record(self, usage, latency: float):
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = (getattr(details, "cached_tokens", None) or 0) if details is not None else 0
+        with self._lock:
+            entry = self._agents.setdefault(CURRENT_AGENT.get(), {
+                "calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0,
+                "cache_hit_calls": 0, "cache_hit_latency": 0.0, "cache_miss_latency": 0.0,
+            })
+            entry["calls"] += 1
+            entry["prompt_tokens"] += usage.prompt_tokens or 0
+            entry["completion_tokens"] += usage.completion_tokens or 0
+            entry["cached_tokens"] += cached
+            if cached:
+                entry["cache_hit_calls"] += 1
+                entry["cache_hit_latency"] += latency
+            else:
+                entry["cache_miss_latency"] += latency
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            agents = {name: dict(entry) for name, entry in self._agents.items()}
+        report = {}
+        for name, e in sorted(agents.items()):
+            misses = e["calls"] - e["cache_hit_calls"]
+            report[name] = {
+                "calls": e["calls"],
+                "prompt_tokens": e["prompt_tokens"],
+                "cached_tokens": e["cached_tokens"],
+                "completion_tokens": e["completion_tokens"],
+                "cached_token_ratio": round(e["cached_tokens"] / e["prompt_tokens"], 3) if e["prompt_tokens"] else 0.0,
+                "avg_latency_cache_hit": round(e["cache_hit_latency"] / e["cache_hit_calls"], 3) if e["cache_hit_calls"] else None,
+                "avg_latency_cache_miss": round(e["cache_miss_latency"] / misses, 3) if misses else None,
+            }
+        return report
+
+PROMPT_USAGE = PromptUsage()
@@ -0,0 +1,78 @@
+import re
+import json
+
+# --- Compact Serialization ---
+# User profiles are embedded in prompts as minified JSON with sorted keys:
+# no indentation, no empty fields, and identical bytes for identical profiles
+# (so prompt cache keys are deterministic too). Default-valued fields are left
+# to the caller: a typed model can drop the ones the user never sent
+# (exclude_unset), but a value equal to its default (age 18, marks 0.0) may
+# still be a real answer, so prune() never compares against defaults.
+
+_EMPTY = (None, "", [], {})
+
+def prune(value):
+    """Recursively drop None, blank strings and empty containers"""
+    if isinstance(value, dict):
+        pruned = {}
+        for key, item in value.items():
+            item = prune(item)
+            if isinstance(item, str):
+                item = item.strip()
+            if item in _EMPTY:
+                continue
+            pruned[key] = item
+        return pruned
+    if isinstance(value, (list, tuple)):
+        items = [prune(item) for item in value]
+        return [item for item in items if item not in _EMPTY]
+    return value
+
+def compact_json(value) -> str:
+    return json.dumps(prune(value), separators=(",", ":"), sort_keys=True, ensure_ascii=False)
+
+# --- Prompt Templates ---
+# Templates are parsed once at import into literal segments and placeholders,
+# then rendered with a single join. Substituted values are never rescanned, so
+# user text containing "{role}" stays literal. Only {identifier} counts as a
+# placeholder; the JSON braces of output schemas are plain text.
+# Templates put their static text first, so the rendered prompt starts with
+# the same bytes on every request.
+
+_PLACEHOLDER = re.compile(r"\{([A-Za-z_][A-Za-z0-9_]*)\}")
+
+class PromptTemplate:
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self._literals = []  # literal text before each placeholder, plus the trailing literal
+        self._fields = []    # placeholder names, in order (may repeat)
+        pos = 0
+        for match in _PLACEHOLDER.finditer(text):
+            self._literals.append(text[pos:match.start()])
+            self._fields.append(match.group(1))
+            pos = match.end()
+        self._literals.append(text[pos:])
+        self.fields = frozenset(self._fields)
+
+    def render(self, **values) -> str:
+        missing = self.fields - values.keys()
+        if missing:
+            raise KeyError(f"Prompt '{self.name}' is missing values for: {', '.join(sorted(missing))}")
+        parts = [self._literals[0]]
+        for field, literal in zip(self._fields, self._literals[1:]):
+            parts.append(str(values[field]))
+            parts.append(literal)
+        return "".join(parts)
+
+class PromptRegistry:
+    def __init__(self):
+        self._templates = {}
+
+    def register(self, name: str, text: str) -> PromptTemplate:
+        if name in self._templates:
+            raise ValueError(f"Prompt '{name}' is already registered")
+        template = PromptTemplate(name, text)
+        self._templates[name] = template
+        return template
+
+PROMPTS = PromptRegistry()
@@ -0,0 +1,206 @@
+import os
+import re
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+# --- Cache Config ---
+# LLM_CACHE_BACKEND=memory (default) keeps everything in-process;
+# LLM_CACHE_BACKEND=sqlite adds an on-disk tier that survives restarts.
+CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory").lower()
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048"))
+CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(6 * 3600)))
+# SQLite writes between LRU trims; a trim only deletes once a namespace is over max_entries
+CACHE_EVICT_INTERVAL = int(os.getenv("LLM_CACHE_EVICT_INTERVAL", "64"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_prompt(text: str) -> str:
+    # Agent prompts are indented f-strings; layout differences must not split the cache
+    return _WHITESPACE.sub(" ", text).strip()
+
+def prompt_cache_key(system_prompt: str, user_prompt: str, models) -> str:
+    payload = json.dumps([normalize_prompt(system_prompt), normalize_prompt(user_prompt), list(models)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class TTLCache:
+    """In-process LRU with per-entry expiry. Values are stored as JSON so callers can't mutate cached results."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, json_text)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, raw = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+        return json.loads(raw)
+
+    def set(self, key: str, value, ttl: float = None, expires_at: float = None):
+        if expires_at is None:
+            expires_at = time.time() + (ttl if ttl is not None else self.ttl)
+        raw = json.dumps(value)
+        with self._lock:
+            self._data[key] = (expires_at, raw)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+class SQLiteCache:
+    """
+    On-disk tier shared by workers on the same host; LRU-evicted past max_entries.
+    Blocking: ResponseCache calls it through asyncio.to_thread, off the event loop.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, namespace: str = "llm", max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._writes = 0  # since the last eviction check
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " namespace TEXT, key TEXT, value TEXT, expires_at REAL, last_access REAL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        # Eviction walks a namespace oldest-first; without this it sorts the whole table
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_lru ON cache (namespace, last_access)")
+
+    def get_entry(self, key: str):
+        """(value, expires_at) or None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+                return None
+            self._conn.execute(
+                "UPDATE cache SET last_access = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key),
+            )
+        return json.loads(row[0]), row[1]
+
+    def get(self, key: str):
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def set(self, key: str, value, ttl: float = None, expires_at: float = None):
+        now = time.time()
+        if expires_at is None:
+            expires_at = now + (ttl if ttl is not None else self.ttl)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), expires_at, now),
+            )
+            self._writes += 1
+            if self._writes >= CACHE_EVICT_INTERVAL:
+                self._writes = 0
+                self._evict()
+
+    def _evict(self):
+        # Caller holds the lock. Counting uses the primary key index; deleting the oldest uses cache_lru.
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)).fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM cache WHERE namespace = ? AND key IN ("
+                " SELECT key FROM cache WHERE namespace = ? ORDER BY last_access ASC LIMIT ?)",
+                (self.namespace, self.namespace, excess),
+            )
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+
+class ResponseCache:
+    """
+    Memory tier in front of an optional SQLite tier, with hit/miss counters.
+    Async so the SQLite tier can run in a worker thread instead of blocking the loop.
+    """
+
+    def __init__(self, memory: TTLCache, disk: SQLiteCache = None):
+        self.memory = memory
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str):
+        value = await self.peek(key)
+        self.record_lookup(value is not None)
+        return value
+
+    async def peek(self, key: str):
+        """get() without touching hit/miss counters, for probes that are not real lookups"""
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            entry = await asyncio.to_thread(self.disk.get_entry, key)
+            if entry is not None:
+                value, expires_at = entry
+                self.memory.set(key, value, expires_at=expires_at)
+        return value
+
+    def record_lookup(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    async def set(self, key: str, value, ttl: float = None):
+        expires_at = time.time() + (ttl if ttl is not None else self.memory.ttl)
+        self.memory.set(key, value, expires_at=expires_at)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value, expires_at=expires_at)
+
+    async def delete(self, key: str):
+        self.memory.delete(key)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.delete, key)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": len(self.memory),
+            "backend": "sqlite" if self.disk is not None else "memory",
+        }
+
+# namespace -> cache, for stats reporting
+CACHES = {}
+
+def make_cache(namespace: str, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL, backend: str = None) -> ResponseCache:
+    disk = None
+    if (backend or CACHE_BACKEND) == "sqlite":
+        disk = SQLiteCache(CACHE_PATH, namespace=namespace, max_entries=max_entries, ttl=ttl)
+    cache = ResponseCache(TTLCache(max_entries, ttl), disk)
+    CACHES[namespace] = cache
+    return cache
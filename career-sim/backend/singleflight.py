@@ -0,0 +1,55 @@
+import copy
+import asyncio
+import weakref
+from deadlines import DeadlineExceeded, current_deadline
+
+class SingleFlight:
+    """
+    De-duplicates concurrent identical work: the first caller for a key runs it,
+    everyone arriving while it is in flight awaits the same result.
+    """
+
+    def __init__(self):
+        # Tasks belong to one event loop, so in-flight maps are kept per loop
+        self._inflight = weakref.WeakKeyDictionary()
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn, deadline=None):
+        """deadline: the caller's own (defaults to the current request's)"""
+        deadline = deadline or current_deadline()
+        inflight = self._inflight.setdefault(asyncio.get_running_loop(), {})
+        failed = None
+        while True:
+            task = inflight.get(key)
+            if task is None or task is failed:
+                break
+            self.coalesced += 1
+            try:
+                # Followers get their own copy so nobody mutates a shared result
+                return copy.deepcopy(await asyncio.shield(task))
+            except DeadlineExceeded:
+                # The leader ran out of its own budget; one with time left takes over instead
+                if deadline is not None and deadline.expired:
+                    raise
+                failed = task
+
+        self.leaders += 1
+        task = asyncio.ensure_future(fn())
+        inflight[key] = task
+        task.add_done_callback(lambda t: self._finished(inflight, key, t))
+        # Shielded: a leader whose client disconnects must not cancel the followers' call
+        return await asyncio.shield(task)
+
+    @staticmethod
+    def _finished(inflight: dict, key: str, task):
+        inflight.pop(key, None)
+        # Every awaiter may have given up (deadline, disconnect); mark the outcome as seen
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        return {
+            "upstream_calls": self.leaders,
+            "coalesced_calls": self.coalesced,
+        }
@@ -0,0 +1,65 @@
+import os
+import asyncio
+
+os.environ.setdefault("OPENROUTER_API_KEY", "offline-test-key")  # never sent anywhere
+
+import llm_gateway
+from admission import UPSTREAM_LIMITER
+
+# Offline check: a stream cancelled before its first token (client disconnect)
+# must give its key/model permit back. The upstream is a fake that never answers.
+
+class HangingStream:
+    def __init__(self):
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await asyncio.sleep(3600)
+
+    async def close(self):
+        self.closed = True
+
+class FakeCompletions:
+    def __init__(self):
+        self.streams = []
+
+    async def create(self, **kwargs):
+        stream = HangingStream()
+        self.streams.append(stream)
+        return stream
+
+class FakeClient:
+    def __init__(self):
+        self.chat = type("Chat", (), {})()
+        self.chat.completions = FakeCompletions()
+
+def in_flight() -> list:
+    snapshot = UPSTREAM_LIMITER.snapshot()
+    return [l["in_flight"] for group in ("keys", "models") for l in snapshot[group].values()]
+
+async def consume():
+    async for _ in llm_gateway.stream_ai_chat([], "hello"):
+        pass
+
+async def test_cancel_before_first_token():
+    client = FakeClient()
+    llm_gateway.get_client = lambda api_key: client
+    tasks = [asyncio.create_task(consume()) for _ in range(3)]
+    await asyncio.sleep(0.2)
+    print(f"In flight while waiting for the first token: {in_flight()}")
+    assert any(in_flight()), "streams never acquired a permit"
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    print(f"In flight after cancelling: {in_flight()}")
+    assert not any(in_flight()), "cancelled streams leaked limiter permits"
+    assert all(s.closed for s in client.chat.completions.streams), "cancelled streams were not closed"
+    print("SUCCESS: permits released and streams closed")
+
+if __name__ == "__main__":
+    asyncio.run(test_cancel_before_first_token())
@@ -0,0 +1,210 @@
+import os
+import re
+import json
+import time
+import secrets
+import threading
+import contextvars
+
+# --- Tracing ---
+# Nested per-request spans (upload, extraction, prompt build, LLM attempts,
+# parsing) to see where a slow request spent its time. Off by default: span()
+# then returns a shared no-op object and the middleware passes requests straight
+# through. TRACING_EXPORTER=console prints each request's span tree;
+# TRACING_EXPORTER=file appends one OTLP/JSON line per request to TRACING_FILE,
+# which an OpenTelemetry Collector can ingest (otlpjsonfile receiver).
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "").lower()  # "", "console" or "file"
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+TRACING_SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "career-sim-backend")
+# Adds a Server-Timing header (stage durations, visible in browser dev tools) to traced responses
+TRACING_SERVER_TIMING = os.getenv("TRACING_SERVER_TIMING", "true").lower() == "true"
+TRACING_ENABLED = TRACING_EXPORTER in ("console", "file")
+
+# W3C trace context: a caller's trace is continued instead of starting a new one
+_TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+CURRENT_SPAN = contextvars.ContextVar("trace_span", default=None)
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set_attribute(self, key: str, value):
+        pass
+
+_NOOP = _NoopSpan()
+
+class Trace:
+    """One request's trace: its id and the spans finished so far"""
+    __slots__ = ("trace_id", "spans")
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans = []
+
+class Span:
+    __slots__ = ("trace", "name", "kind", "span_id", "parent_id", "attributes", "start_ns", "end_ns", "error", "_token")
+
+    INTERNAL, SERVER = 1, 2  # OTLP SpanKind values
+
+    def __init__(self, trace: Trace, name: str, parent_id: str = None, attributes: dict = None, kind: int = INTERNAL):
+        self.trace = trace
+        self.name = name
+        self.kind = kind
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes or {}
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+        self._token = None
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def __enter__(self):
+        self._token = CURRENT_SPAN.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None and not isinstance(exc, GeneratorExit):
+            self.error = f"{exc_type.__name__}: {exc}"
+        self.end_ns = time.time_ns()
+        self.trace.spans.append(self)
+        try:
+            CURRENT_SPAN.reset(self._token)
+        except ValueError:
+            pass  # streaming generator finalized outside the task that iterated it
+        return False
+
+def span(name: str, **attributes):
+    """
+    Child of the current span, used as `with span("pdf.extract"):`.
+    Outside a traced request (or with tracing off) this is a no-op.
+    """
+    parent = CURRENT_SPAN.get()
+    if parent is None:
+        return _NOOP
+    return Span(parent.trace, name, parent.span_id, attributes)
+
+def server_timing(trace: Trace, root: Span) -> str:
+    """Server-Timing value: finished stage durations summed per span name, plus the total so far"""
+    totals = {}
+    for s in trace.spans:
+        if s is not root:
+            totals[s.name] = totals.get(s.name, 0.0) + s.duration_ms()
+    parts = [f"{name};dur={ms:.1f}" for name, ms in totals.items()]
+    parts.append(f"total;dur={root.duration_ms():.1f}")
+    return ", ".join(parts)
+
+# --- Exporters ---
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def _otlp_span(s: Span) -> dict:
+    record = {
+        "traceId": s.trace_id,
+        "spanId": s.span_id,
+        "name": s.name,
+        "kind": s.kind,
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano": str(s.end_ns),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+        "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+    }
+    if s.parent_id:
+        record["parentSpanId"] = s.parent_id
+    return record
+
+_file_lock = threading.Lock()
+
+def _export_file(spans: list):
+    line = json.dumps({"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACING_SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "career-sim"}, "spans": [_otlp_span(s) for s in spans]}],
+    }]})
+    with _file_lock:
+        with open(TRACING_FILE, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+def _export_console(spans: list, root: Span):
+    children = {}
+    for s in spans:
+        children.setdefault(s.parent_id, []).append(s)
+
+    def walk(s: Span, depth: int):
+        error = f"  !! {s.error}" if s.error else ""
+        print(f"{'  ' * depth}{s.name} {s.duration_ms():.1f}ms{error}")
+        for child in sorted(children.get(s.span_id, []), key=lambda c: c.start_ns):
+            walk(child, depth + 1)
+
+    print(f"Trace {root.trace_id}:")
+    walk(root, 1)
+
+def export(trace: Trace, root: Span):
+    spans = trace.spans
+    try:
+        if TRACING_EXPORTER == "file":
+            _export_file(spans)
+        else:
+            _export_console(spans, root)
+    except Exception as e:
+        print(f"Trace export failed: {e}")
+
+class TracingMiddleware:
+    """Root span per HTTP request; adds Server-Timing and exports the trace when the response ends"""
+
+    def __init__(self, app, enabled: bool = TRACING_ENABLED):
+        self.app = app
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        trace_id, parent_id = secrets.token_hex(16), None
+        for name, value in scope.get("headers", []):
+            if name == b"traceparent":
+                match = _TRACEPARENT.match(value.decode("latin-1").strip())
+                if match:
+                    trace_id, parent_id = match.groups()
+                break
+        trace = Trace(trace_id)
+        root = Span(trace, f"{scope['method']} {scope['path']}", parent_id, {"http.method": scope["method"]}, Span.SERVER)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                root.set_attribute("http.status_code", message["status"])
+                if TRACING_SERVER_TIMING:
+                    # Streamed responses only report the stages finished before the first byte
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing(trace, root).encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            with root:
+                await self.app(scope, receive, send_with_timing)
+        finally:
+            route = getattr(scope.get("route"), "path", None)
+            if route is not None:
+                root.name = f"{scope['method']} {route}"
+                root.set_attribute("http.route", route)
+            export(trace, root)
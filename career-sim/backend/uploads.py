@@ -0,0 +1,101 @@
+import os
+import json
+import hashlib
+import tempfile
+from contextlib import asynccontextmanager
+from fastapi import HTTPException, UploadFile
+from tracing import span
+
+# --- Upload Limits ---
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 64 * 1024
+# Multipart boundaries and the small form fields ride along with the file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+def _format_size(size: int) -> str:
+    """Human-readable byte count: 10 MB, 1.5 MB, 512 KB"""
+    if size >= 1024 * 1024:
+        return f"{round(size / (1024 * 1024), 1):g} MB"
+    if size >= 1024:
+        return f"{round(size / 1024, 1):g} KB"
+    return f"{size} bytes"
+
+def too_large(max_bytes: int = MAX_UPLOAD_BYTES) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"File too large. Maximum upload size is {_format_size(max_bytes)}.")
+
+class UploadLimitMiddleware:
+    """
+    Rejects oversized request bodies on upload routes before they are parsed:
+    a declared Content-Length over the limit is refused outright, and chunked
+    bodies are cut off as soon as the running byte count crosses it.
+    """
+
+    def __init__(self, app, paths, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.app = app
+        self.paths = set(paths)
+        self.max_body = max_bytes + MULTIPART_OVERHEAD_BYTES
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        declared = headers.get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > self.max_body:
+            error = too_large(self.max_bytes)
+            body = json.dumps({"detail": error.detail}).encode()
+            await send({"type": "http.response.start", "status": 413, "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ]})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body:
+                    # Surfaces through FastAPI's body parsing as a normal 413
+                    raise too_large(self.max_bytes)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+class SpooledUpload:
+    def __init__(self, path: str, size: int, sha256: str):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+@asynccontextmanager
+async def spooled_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES):
+    """
+    Stream an upload into a temp file in fixed-size chunks (hashing on the way)
+    so no full in-memory copy is ever made; yields a SpooledUpload whose path
+    can be handed straight to pdfplumber. The file is removed afterwards.
+    """
+    suffix = os.path.splitext(file.filename or "")[1]
+    fd, path = tempfile.mkstemp(prefix="upload-", suffix=suffix)
+    try:
+        hasher = hashlib.sha256()
+        size = 0
+        with span("upload.spool") as s, os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise too_large(max_bytes)
+                hasher.update(chunk)
+                out.write(chunk)
+            s.set_attribute("bytes", size)
+        yield SpooledUpload(path, size, hasher.hexdigest())
+    finally:
+        os.unlink(path)
@@ -25,6 +25,7 @@ export default function AssessmentPage() {
 
     // Quiz State
     const [quizData, setQuizData] = useState<any>(null);
+    const [narrativeStatus, setNarrativeStatus] = useState<'pending' | 'ready' | 'unavailable'>('pending');
     const [currentQIndex, setCurrentQIndex] = useState(0);
     const [answers, setAnswers] = useState<{ [key: number]: number }>({}); // q_id -> selected_index
 
@@ -56,7 +57,11 @@ export default function AssessmentPage() {
                 });
             }
 
-            if (!res.ok) throw new Error("Failed to generate quiz");
+            if (!res.ok) {
+                const errData = await res.json().catch(() => ({}));
+                if (res.status === 413) throw new Error(errData.detail || "File too large. Please upload a smaller file.");
+                throw new Error(errData.detail || "Failed to generate quiz");
+            }
             const data = await res.json();
 
             setQuizData(data);
@@ -74,6 +79,28 @@ export default function AssessmentPage() {
         setAnswers(prev => ({ ...prev, [qId]: optionIdx }));
     };
 
+    // The narrative endpoint answers 504 while generation is still running; other failures are final
+    const NARRATIVE_MAX_ATTEMPTS = 3;
+
+    const loadNarrative = async (narrativeId: string) => {
+        for (let attempt = 0; attempt < NARRATIVE_MAX_ATTEMPTS; attempt++) {
+            try {
+                const res = await fetch(`http://localhost:8000/api/evaluate-assessment/${narrativeId}/narrative`);
+                if (res.status === 504) continue;
+                if (!res.ok) break;
+                const narrative = await res.json();
+                if (!narrative.summary) break;
+                // Ignore late answers for a result the user has already left
+                setResult((prev: any) => prev?.narrative_id === narrativeId ? { ...prev, ...narrative } : prev);
+                setNarrativeStatus('ready');
+                return;
+            } catch (e) {
+                break;
+            }
+        }
+        setNarrativeStatus('unavailable');
+    };
+
     const handleSubmitQuiz = async () => {
         setLoading(true);
         // Transform answers to format backend expects
@@ -96,6 +123,14 @@ export default function AssessmentPage() {
             const data = await res.json();
             setResult(data);
             setStep('result');
+
+            // Score is shown right away; the mentor summary arrives separately
+            if (data.narrative_id) {
+                setNarrativeStatus('pending');
+                loadNarrative(data.narrative_id);
+            } else {
+                setNarrativeStatus(data.summary ? 'ready' : 'unavailable');
+            }
         } catch (e) {
             alert("Error evaluating: " + e);
         } finally {
@@ -108,6 +143,7 @@ export default function AssessmentPage() {
         setQuizData(null);
         setResult(null);
         setAnswers({});
+        setNarrativeStatus('pending');
     };
 
     return (
@@ -367,7 +403,9 @@ export default function AssessmentPage() {
                                         {result.score >= 80 ? "Mastery Achieved! 🚀" : result.score >= 50 ? "Solid Foundation 📈" : "Room to Grow 🌱"}
                                     </h2>
                                     <p className="text-slate-400 max-w-lg mx-auto leading-relaxed">
-                                        {result.summary}
+                                        {result.summary ?? (narrativeStatus === 'unavailable'
+                                            ? "Mentor feedback is unavailable right now. Your score and focus areas below are still accurate."
+                                            : "Preparing your mentor feedback...")}
                                     </p>
                                 </CardContent>
                             </Card>
@@ -48,6 +48,7 @@ export default function InterviewPage() {
     const [messages, setMessages] = useState<Message[]>([]);
     const [currentInput, setCurrentInput] = useState('');
     const [lastQuestion, setLastQuestion] = useState('');
+    const [sessionId, setSessionId] = useState<string | null>(null); // server keeps the transcript
     const chatEndRef = useRef<HTMLDivElement>(null);
 
     // Voice State
@@ -129,6 +130,7 @@ export default function InterviewPage() {
 
             setMessages([{ role: 'ai', content: data.message }, { role: 'ai', content: data.question }]);
             setLastQuestion(data.question);
+            setSessionId(data.session_id ?? null);
             setStep('chat');
         } catch (e) {
             alert("Error: " + e);
@@ -151,13 +153,15 @@ export default function InterviewPage() {
             const res = await fetch('http://localhost:8000/api/interview-interaction', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    role,
-                    history: [],
-                    last_question: lastQuestion,
-                    user_answer: userMsg,
-                    persona
-                })
+                body: JSON.stringify(sessionId
+                    ? { session_id: sessionId, user_answer: userMsg }
+                    : {
+                        role,
+                        history: [],
+                        last_question: lastQuestion,
+                        user_answer: userMsg,
+                        persona
+                    })
             });
 
             if (!res.ok) throw new Error("Failed to send message");
@@ -196,10 +200,9 @@ export default function InterviewPage() {
             const res = await fetch('http://localhost:8000/api/interview-feedback', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    role,
-                    history: historyPairs
-                })
+                body: JSON.stringify(sessionId
+                    ? { session_id: sessionId }
+                    : { role, history: historyPairs })
             });
 
             if (!res.ok) throw new Error("Failed to get feedback");
@@ -67,7 +67,8 @@ export default function ResumePage() {
             });
 
             if (!res.ok) {
-                const errData = await res.json();
+                const errData = await res.json().catch(() => ({}));
+                if (res.status === 413) throw new Error(errData.detail || "File too large. Please upload a smaller PDF.");
                 throw new Error(errData.detail || "Analysis failed");
             }
 